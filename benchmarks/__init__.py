@@ -0,0 +1,3 @@
+# 此目录为无界面基准测试 (不依赖 Qt / Windows)
+# 在仓库根目录运行: python -m benchmarks.<模块名>
+# 全部核心基准: python -m benchmarks.run_suite --profile quick|standard|full [--baseline 基线.json]
@@ -0,0 +1,50 @@
+"""历史记录搜索 (首页 500 条) 延迟：FTS5 trigram 与 LIKE 全表扫描对比
+
+用法: python -m benchmarks.bench_history_search --sizes 1000000,5000000
+关键字取自已有 SN / 箱号的中间片段；短于 3 个字符的关键字走 LIKE。
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from benchmarks.common import (open_db, fill_records, parse_sizes, synthetic_sn, synthetic_box,
+                               time_calls, write_results)
+
+LIKE_WHERE = "(sn LIKE ? OR box_no LIKE ?)"
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--sizes", default="1000000,5000000")
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "bench_history_search.db"))
+    args = ap.parse_args(argv)
+
+    rnd = random.Random(42)
+    db = open_db(args.db)
+    results = []
+    filled = 0
+    for size in parse_sizes(args.sizes):
+        fill_records(db, filled, size)
+        filled = size
+        kinds = {
+            "sn_substring": [synthetic_sn(rnd.randrange(size))[3:] for _ in range(args.queries)],
+            "box_substring": [synthetic_box(rnd.randrange(size))[2:] for _ in range(args.queries)],
+            "miss": [f"Q{rnd.randrange(10 ** 6):06d}" for _ in range(args.queries)],
+            "short_like": [f"{rnd.randrange(100):02d}" for _ in range(args.queries)],
+        }
+        row = {"records": size, "fts": db.has_fts}
+        for kind, kws in kinds.items():
+            row[kind] = time_calls(lambda kw: db.history_page(*db.history_filter(kw)), kws)
+            if kind != "short_like":
+                row[kind + "_like"] = time_calls(
+                    lambda kw: db.history_page(LIKE_WHERE, [f"%{kw}%"] * 2), kws[:10])
+        results.append(row)
+    db.close()
+    write_results("history_search", results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
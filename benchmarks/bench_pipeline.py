@@ -0,0 +1,88 @@
+"""扫码→打印→写库 端到端吞吐 (记录模式打印后端，无需 Windows / BarTender)
+
+用法: python -m benchmarks.bench_pipeline --boxes 500 --qty 50 --latency-ms 0
+按打印页的处理顺序执行：逐个 SN 查重 → 占用流水号并生成箱号 → 打印 → 写入记录。
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from benchmarks.common import open_db, summarize, write_results
+from src.box_rules import BoxRuleEngine
+from src.printer import create_printer
+
+
+def setup_product(db, qty):
+    c = db.conn.cursor()
+    c.execute("INSERT INTO box_rules (name, rule_string) VALUES (?, ?)", ("基准", "MZXH{SN4}{Y1}{M1}{SEQ5}"))
+    rid = c.lastrowid
+    c.execute("""INSERT INTO products (name, spec, model, color, sn4, sku, code69, qty, weight, template_path, rule_id, sn_rule_id)
+                 VALUES (?,?,?,?,?,?,?,?,?,?,?,?)""",
+              ("基准产品", "规格", "型号", "黑色", "BNCH", "SKU1", "6900000000000", qty, "1kg", "bench.btw", rid, 0))
+    db.conn.commit()
+    c.execute("SELECT * FROM products WHERE id=?", (c.lastrowid,))
+    return dict(zip([d[0] for d in c.description], c.fetchone()))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--boxes", type=int, default=500)
+    ap.add_argument("--qty", type=int, default=50)
+    ap.add_argument("--latency-ms", type=int, default=0)
+    ap.add_argument("--block-size", type=int, default=1, help="箱号流水号每次预留数量")
+    ap.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "bench_pipeline.db"))
+    args = ap.parse_args(argv)
+
+    db = open_db(args.db)
+    db.load_sn_filter(background=False)
+    engine = BoxRuleEngine(db, block_size=args.block_size)
+    printer = create_printer("recording", latency_ms=args.latency_ms)
+    p = setup_product(db, args.qty)
+
+    key = engine.counter_key(p['rule_id'], p['id'], 0)
+    stages = {"check": [], "take_seq": [], "box_no": [], "print": [], "save": []}
+    n = 0
+    t_start = time.perf_counter()
+    for _ in range(args.boxes):
+        sns = []
+        for _ in range(args.qty):
+            sn = f"BNCH{n:010d}"; n += 1
+            t0 = time.perf_counter()
+            db.check_sn_exists(sn)
+            stages["check"].append((time.perf_counter() - t0) * 1e6)
+            sns.append(sn)
+
+        t0 = time.perf_counter()
+        seq = engine.take_sequence(key)
+        t1 = time.perf_counter()
+        box_no, _ = engine.generate_box_no(p['rule_id'], p, 0, seq)
+        t2 = time.perf_counter()
+        dat = {"xianghao": box_no, **{str(i + 1): sn for i, sn in enumerate(sns)}}
+        printer.print_label(p['template_path'], dat)
+        t3 = time.perf_counter()
+        db.save_box_records(box_no, p, sns, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                            payload=(p['template_path'], dat))
+        t4 = time.perf_counter()
+        for k, a, b in (("take_seq", t0, t1), ("box_no", t1, t2), ("print", t2, t3), ("save", t3, t4)):
+            stages[k].append((b - a) * 1e6)
+    total = time.perf_counter() - t_start
+    engine.release_blocks()
+    db.close()
+
+    results = {
+        "boxes": args.boxes,
+        "qty": args.qty,
+        "latency_ms": args.latency_ms,
+        "block_size": args.block_size,
+        "total_seconds": round(total, 3),
+        "boxes_per_hour": round(args.boxes / total * 3600, 1),
+        "stages": {k: summarize(v) for k, v in stages.items()},
+    }
+    write_results("pipeline", results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
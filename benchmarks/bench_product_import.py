@@ -0,0 +1,76 @@
+"""产品批量导入 (src.product_import) 耗时：读取文件、整列校验、新增 / 更新 / 仅校验写入
+
+用法: python -m benchmarks.bench_product_import --sizes 10000,100000 [--xlsx]
+默认用 CSV 文件 (读取快，聚焦校验与写库)；--xlsx 同时测量 Excel 文件读取。每个规模使用全新数据库。
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.common import open_db, parse_sizes, write_results
+from src import product_import
+
+
+# 非法箱规数量 (依次轮换)，含 to_numeric 可解析但无法转为整数的 inf / 溢出值
+BAD_QTY = ("x", "inf", "-inf", "1e400", "99999999999999999999")
+
+
+def make_frame(n, bad_every=100):
+    """合成产品表：每 bad_every 行一行箱规数量非法，用于覆盖拒绝路径"""
+    import pandas as pd
+    return pd.DataFrame({
+        "name": [f"产品{i:06d}" for i in range(n)],
+        "spec": "规格", "model": "型号", "color": "黑色",
+        "sn4": [f"S{i:07d}" for i in range(n)],
+        "sku": [f"SKU{i}" for i in range(n)],
+        "code69": [f"69{i:011d}" for i in range(n)],
+        "qty": [BAD_QTY[i // bad_every % len(BAD_QTY)] if bad_every and i % bad_every == 0 else "50"
+                for i in range(n)],
+        "weight": "1kg", "template_path": "bench.btw", "rule_id": "0", "sn_rule_id": "0",
+    })
+
+
+def timed(fn, *a, **kw):
+    t0 = time.perf_counter()
+    out = fn(*a, **kw)
+    return round(time.perf_counter() - t0, 3), out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--sizes", default="10000,100000")
+    ap.add_argument("--xlsx", action="store_true", help="同时测量 Excel 文件读取 (openpyxl 较慢)")
+    ap.add_argument("--dir", default=tempfile.gettempdir())
+    args = ap.parse_args(argv)
+
+    results = []
+    for size in parse_sizes(args.sizes):
+        df = make_frame(size)
+        csv_path = os.path.join(args.dir, f"bench_import_{size}.csv")
+        df.to_csv(csv_path, index=False, encoding="utf-8-sig")
+        row = {"rows": size}
+        row["read_csv_seconds"], df = timed(product_import.read_catalog, csv_path)
+        if args.xlsx:
+            xlsx_path = os.path.join(args.dir, f"bench_import_{size}.xlsx")
+            df.to_excel(xlsx_path, index=False)
+            row["read_xlsx_seconds"], _ = timed(product_import.read_catalog, xlsx_path)
+            os.remove(xlsx_path)
+        os.remove(csv_path)
+        row["normalize_seconds"], _ = timed(product_import.normalize, df)
+
+        db = open_db(os.path.join(args.dir, "bench_product_import.db"))
+        for mode in (product_import.MODE_DRY_RUN, product_import.MODE_INSERT, product_import.MODE_UPSERT):
+            secs, res = timed(product_import.import_products, db, df, mode)
+            row[mode] = {"seconds": secs, "inserted": res["inserted"], "updated": res["updated"],
+                         "rejected": res["rejected"],
+                         "rows_per_second": round(size / secs, 1) if secs else None}
+        row["products"] = db.read_conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        db.close()
+        results.append(row)
+    write_results("product_import", results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
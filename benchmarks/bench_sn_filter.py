@@ -0,0 +1,54 @@
+"""SN 布隆过滤器：加载耗时、内存占用 (每百万 SN) 与命中统计
+
+用法: python -m benchmarks.bench_sn_filter --sizes 100000,1000000
+扫码场景绝大多数是未打印的新 SN，因此 miss 路径是关注重点。
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import (open_db, fill_records, parse_sizes, synthetic_sn,
+                               time_calls, write_results)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--sizes", default="100000,1000000")
+    ap.add_argument("--queries", type=int, default=20000)
+    ap.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "bench_sn_filter.db"))
+    args = ap.parse_args(argv)
+
+    rnd = random.Random(7)
+    db = open_db(args.db)
+    results = []
+    filled = 0
+    for size in parse_sizes(args.sizes):
+        fill_records(db, filled, size)
+        filled = size
+        hits = [synthetic_sn(rnd.randrange(size)) for _ in range(args.queries)]
+        misses = [synthetic_sn(size + rnd.randrange(size)) for _ in range(args.queries)]
+
+        db.sn_filter = None
+        no_filter = {"hit": time_calls(db.check_sn_exists, hits), "miss": time_calls(db.check_sn_exists, misses)}
+
+        t0 = time.perf_counter()
+        db.load_sn_filter(background=False)
+        load_s = time.perf_counter() - t0
+        with_filter = {"hit": time_calls(db.check_sn_exists, hits), "miss": time_calls(db.check_sn_exists, misses)}
+
+        results.append({
+            "records": size,
+            "load_seconds": round(load_s, 3),
+            "no_filter": no_filter,
+            "with_filter": with_filter,
+            "filter": db.sn_filter_stats(),
+        })
+    db.close()
+    write_results("sn_filter", results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""扫码查重 (Database.check_sn_exists) 延迟随历史记录量的变化
+
+用法: python -m benchmarks.bench_sn_lookup --sizes 10000,100000,1000000,10000000
+数据库逐级追加记录，避免每个规模都从零生成。
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from benchmarks.common import (open_db, fill_records, parse_sizes, synthetic_sn,
+                               time_calls, write_results)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--sizes", default="10000,100000,1000000,10000000")
+    ap.add_argument("--queries", type=int, default=5000)
+    ap.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "bench_sn_lookup.db"))
+    args = ap.parse_args(argv)
+
+    rnd = random.Random(42)
+    db = open_db(args.db)
+    results = []
+    filled = 0
+    for size in parse_sizes(args.sizes):
+        fill_records(db, filled, size)
+        filled = size
+        hits = [synthetic_sn(rnd.randrange(size)) for _ in range(args.queries)]
+        misses = [synthetic_sn(size + rnd.randrange(size)) for _ in range(args.queries)]
+        results.append({
+            "records": size,
+            "hit": time_calls(db.check_sn_exists, hits),
+            "miss": time_calls(db.check_sn_exists, misses),
+        })
+    db.close()
+    write_results("sn_lookup", results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
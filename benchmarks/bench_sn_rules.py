@@ -0,0 +1,52 @@
+"""SN 校验 (打印页 validate_sn 的路径：SnRuleEngine.get 取缓存规则 + validate) 延迟
+
+用法: python -m benchmarks.bench_sn_rules --calls 50000
+分别测量合格 SN、前缀错误、格式错误、带扫码枪尾部字符的 SN，以及规则失效后重新编译的开销。
+"""
+import argparse
+import os
+import tempfile
+
+from benchmarks.common import open_db, time_calls, write_results
+from src.sn_rules import SnRuleEngine
+
+RULE = ("基准", "{SN4}{BATCH}{SEQ8}", 13)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--calls", type=int, default=50000)
+    ap.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "bench_sn_rules.db"))
+    args = ap.parse_args(argv)
+
+    db = open_db(args.db)
+    c = db.conn.cursor()
+    c.execute("INSERT INTO sn_rules (name, rule_string, length) VALUES (?, ?, ?)", RULE)
+    rid = c.lastrowid
+    db.conn.commit()
+    engine = SnRuleEngine(db)
+
+    def validate(sn):
+        return engine.validate(engine.get(rid, "BNCH", "0"), sn)
+
+    n = args.calls
+    kinds = {
+        "valid": [f"BNCH0{i:08d}" for i in range(n)],
+        "bad_prefix": [f"XXXX0{i:08d}" for i in range(n)],
+        "bad_format": [f"BNCH0{i:07d}A" for i in range(n)],
+        "trailing_junk": [f"BNCH0{i:08d}\r\n\u200b" for i in range(n)],
+    }
+    results = {kind: time_calls(validate, sns) for kind, sns in kinds.items()}
+
+    def recompile(sn):
+        engine.invalidate(rid)
+        return validate(sn)
+
+    results["after_invalidate"] = time_calls(recompile, kinds["valid"][:min(n, 5000)])
+    db.close()
+    write_results("sn_rules", results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
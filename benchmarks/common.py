@@ -0,0 +1,95 @@
+"""基准测试公共工具：合成数据库、计时统计与 JSON 结果输出"""
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import time
+
+from src.database import Database
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BASE_TIME = datetime.datetime(2024, 1, 1, 8, 0, 0)
+
+
+def parse_sizes(text):
+    """'10000,100000' -> [10000, 100000]"""
+    return sorted(int(x) for x in text.split(",") if x.strip())
+
+
+def synthetic_sn(i):
+    return f"SN{i:010d}"
+
+
+def synthetic_box(i, box_qty=50):
+    return f"BX{i // box_qty:08d}"
+
+
+def open_db(path, fresh=True):
+    """创建 (或打开) 合成数据库，表结构与正式程序一致"""
+    if fresh:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix): os.remove(path + suffix)
+    return Database(path)
+
+
+def fill_records(db, start, end, box_qty=50, products=20, batch=50000):
+    """追加第 [start, end) 条合成打印记录 (每 30 秒一箱，按产品轮转)；箱 id = 箱序号 + 1"""
+    cur = db.conn.cursor()
+    box_sql = ("INSERT OR IGNORE INTO boxes (id, box_no, product_id, name, spec, model, color, code69, print_ts, print_day, qty) "
+               "VALUES (?,?,?,?,?,?,?,?,?,?,?)")
+    rec_sql = "INSERT INTO records (box_id, seq, sn) VALUES (?,?,?)"
+    for lo in range(start, end, batch):
+        boxes, rows = [], []
+        for i in range(lo, min(lo + batch, end)):
+            box = i // box_qty
+            if i % box_qty == 0 or i == lo:
+                text = (BASE_TIME + datetime.timedelta(seconds=box * 30)).strftime(Database.TIME_FMT)
+                boxes.append((box + 1, synthetic_box(i, box_qty), box % products + 1, f"产品{box % products:02d}",
+                              "规格", "型号", "黑色", "6900000000000", Database.to_ts(text), Database.day_key(text), box_qty))
+            rows.append((box + 1, i % box_qty + 1, synthetic_sn(i)))
+        cur.executemany(box_sql, boxes)
+        cur.executemany(rec_sql, rows)
+        db.conn.commit()
+
+
+def summarize(samples_us):
+    """微秒样本 -> 统计摘要"""
+    s = sorted(samples_us)
+    if not s: return {"n": 0}
+
+    def pct(p):
+        return round(s[min(len(s) - 1, int(len(s) * p))], 2)
+
+    return {"n": len(s), "mean_us": round(statistics.mean(s), 2), "p50_us": pct(0.50),
+            "p95_us": pct(0.95), "p99_us": pct(0.99), "max_us": round(s[-1], 2)}
+
+
+def time_calls(fn, args):
+    """逐个参数调用 fn，返回每次调用耗时的统计摘要"""
+    samples = []
+    for a in args:
+        t0 = time.perf_counter()
+        fn(a)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return summarize(samples)
+
+
+def write_results(name, results):
+    """写入 benchmarks/results/<name>_<时间戳>.json 并打印到控制台"""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    payload = {
+        "benchmark": name,
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    path = os.path.join(RESULTS_DIR, f"{name}_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    print(json.dumps(payload, ensure_ascii=False, indent=2))
+    print(f"结果已写入: {path}")
+    return path
@@ -0,0 +1,123 @@
+"""无界面基准测试套件：依次运行各核心引擎基准，合并写入一个 JSON，并可与固定基线对比
+
+用法:
+    python -m benchmarks.run_suite --profile standard
+    python -m benchmarks.run_suite --profile full --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run_suite --baseline benchmarks/baseline.json --tolerance 0.2
+对比时只看 p50 / 均值 / 秒数类指标，比基线慢超过 tolerance 的项列为退化并以非零状态退出。
+基线与机器相关，应在同一台工位机 (或同一配置) 上生成和对比。
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+
+from benchmarks import (bench_box_rules, bench_sn_rules, bench_sn_lookup, bench_history_search,
+                        bench_product_import, bench_pipeline)
+from benchmarks.common import write_results
+
+# 规模档位: 基准名 -> (模块, 参数)
+PROFILES = {
+    "quick": {
+        "box_rules": (bench_box_rules, ["--calls", "5000"]),
+        "sn_rules": (bench_sn_rules, ["--calls", "10000"]),
+        "sn_lookup": (bench_sn_lookup, ["--sizes", "100000", "--queries", "2000"]),
+        "history_search": (bench_history_search, ["--sizes", "100000", "--queries", "20"]),
+        "product_import": (bench_product_import, ["--sizes", "10000"]),
+        "pipeline": (bench_pipeline, ["--boxes", "100"]),
+    },
+    "standard": {
+        "box_rules": (bench_box_rules, []),
+        "sn_rules": (bench_sn_rules, []),
+        "sn_lookup": (bench_sn_lookup, ["--sizes", "100000,1000000"]),
+        "history_search": (bench_history_search, ["--sizes", "1000000"]),
+        "product_import": (bench_product_import, ["--sizes", "10000,100000"]),
+        "pipeline": (bench_pipeline, []),
+    },
+    "full": {
+        "box_rules": (bench_box_rules, []),
+        "sn_rules": (bench_sn_rules, []),
+        "sn_lookup": (bench_sn_lookup, ["--sizes", "100000,1000000,10000000"]),
+        "history_search": (bench_history_search, ["--sizes", "1000000,10000000"]),
+        "product_import": (bench_product_import, ["--sizes", "10000,100000"]),
+        "pipeline": (bench_pipeline, ["--boxes", "1000"]),
+    },
+}
+# 参与基线对比的指标 (越小越好)
+COMPARE_SUFFIXES = ("p50_us", "mean_us", "seconds")
+# 列表元素按这些字段命名 (如 records=1000000)，使不同档位的结果可以按规模对齐
+LIST_KEYS = ("records", "rows", "block_size")
+
+
+def flatten(obj, prefix=""):
+    """嵌套结果 -> {'sn_lookup/records=100000/hit/p50_us': 值}"""
+    out = {}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            out.update(flatten(v, f"{prefix}/{k}" if prefix else str(k)))
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj):
+            label = next((f"{k}={v[k]}" for k in LIST_KEYS if isinstance(v, dict) and k in v), str(i))
+            out.update(flatten(v, f"{prefix}/{label}"))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        out[prefix] = obj
+    return out
+
+
+def compare(results, baseline, tolerance):
+    """返回 (退化项, 改善项, 对比项数)，每项为 (指标, 基线值, 当前值, 比值)"""
+    cur, base = flatten(results), flatten(baseline)
+    worse, better, n = [], [], 0
+    for key, old in base.items():
+        if not key.endswith(COMPARE_SUFFIXES) or key not in cur or not old: continue
+        n += 1
+        ratio = cur[key] / old
+        if ratio > 1 + tolerance: worse.append((key, old, cur[key], ratio))
+        elif ratio < 1 - tolerance: better.append((key, old, cur[key], ratio))
+    return worse, better, n
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--profile", choices=sorted(PROFILES), default="standard")
+    ap.add_argument("--only", default="", help="只运行指定基准 (逗号分隔)，如 box_rules,sn_lookup")
+    ap.add_argument("--baseline", help="与该基线文件对比")
+    ap.add_argument("--save-baseline", help="把本次结果保存为基线文件")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="允许的相对变慢比例")
+    args = ap.parse_args(argv)
+
+    only = {x.strip() for x in args.only.split(",") if x.strip()}
+    suite = {"profile": args.profile, "benchmarks": {}, "seconds": {}}
+    for name, (module, bench_args) in PROFILES[args.profile].items():
+        if only and name not in only: continue
+        print(f"运行 {name} {' '.join(bench_args)} ...", flush=True)
+        t0 = time.perf_counter()
+        # 各基准自身的 JSON 输出较长，套件只汇总
+        with contextlib.redirect_stdout(io.StringIO()):
+            suite["benchmarks"][name] = module.main(bench_args)
+        suite["seconds"][name] = round(time.perf_counter() - t0, 1)
+        print(f"  完成，用时 {suite['seconds'][name]}s")
+    with contextlib.redirect_stdout(io.StringIO()):
+        path = write_results("suite", suite)
+    print(f"套件结果已写入: {path}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(suite, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        worse, better, n = compare(suite["benchmarks"], baseline.get("benchmarks", {}), args.tolerance)
+        print(f"与基线对比 {n} 项 (容差 ±{args.tolerance:.0%}): 退化 {len(worse)} 项, 改善 {len(better)} 项")
+        for title, rows in (("退化", worse), ("改善", better)):
+            for key, old, new, ratio in sorted(rows, key=lambda r: -abs(r[3] - 1)):
+                print(f"  [{title}] {key}: {old} -> {new} ({ratio:.2f}x)")
+        if worse: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""启动时间预算检查：测量从进程启动到主窗口显示的时间，超出预算时以非零状态退出
+
+用法: python -m benchmarks.startup_budget --budget 1.5 --runs 5
+每次在全新子进程 (临时工作目录、空数据库、offscreen 平台) 中构建 MainWindow 并 show()，
+取中位数与预算比较；同时检查启动阶段没有导入 pandas / openpyxl 等重型模块。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import write_results
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 启动阶段不应加载的模块 (只在导入/导出或检查更新时才需要)
+HEAVY_MODULES = ("pandas", "openpyxl", "xlsxwriter", "requests")
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv)
+from src.ui.main_window import MainWindow
+w = MainWindow()
+w.show()
+app.processEvents()
+elapsed = time.perf_counter() - t0
+heavy = [m for m in %r if m in sys.modules]
+w.close()
+print("RESULT " + json.dumps({"seconds": elapsed, "heavy": heavy}))
+"""
+
+
+def run_once():
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    env["PYTHONPATH"] = REPO_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    with tempfile.TemporaryDirectory() as cwd:
+        out = subprocess.run([sys.executable, "-c", CHILD % (HEAVY_MODULES,)], cwd=cwd, env=env,
+                             capture_output=True, text=True, timeout=120)
+    for line in out.stdout.splitlines():
+        if line.startswith("RESULT "): return json.loads(line[7:])
+    raise RuntimeError(f"子进程未返回结果 (退出码 {out.returncode}):\n{out.stderr[-2000:]}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--budget", type=float, default=1.5, help="启动到窗口显示的预算 (秒，取中位数比较)")
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    times = [r["seconds"] for r in runs]
+    heavy = sorted({m for r in runs for m in r["heavy"]})
+    median = statistics.median(times)
+    write_results("startup_budget", {
+        "budget_seconds": args.budget,
+        "runs": args.runs,
+        "median_seconds": round(median, 3),
+        "min_seconds": round(min(times), 3),
+        "max_seconds": round(max(times), 3),
+        "heavy_modules_loaded": heavy,
+    })
+    failed = False
+    if median > args.budget:
+        print(f"启动时间超出预算: {median:.3f}s > {args.budget:.3f}s")
+        failed = True
+    if heavy:
+        print(f"启动阶段加载了重型模块: {', '.join(heavy)}")
+        failed = True
+    if failed: sys.exit(1)
+    print(f"启动时间 {median:.3f}s (预算 {args.budget:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""多实例箱号计数压力测试：多个进程同时为同一产品取号，校验箱号无重复
+
+用法: python -m benchmarks.stress_box_counter --procs 4 --boxes 2000 --block-size 1
+每个进程模拟一个程序实例 (独立连接、独立 BoxRuleEngine)，共享同一个数据库文件。
+发现重复箱号时以非零状态退出。
+"""
+import argparse
+import collections
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import open_db, write_results
+
+RULE = "MZXH{SN4}{Y1}{M1}{SEQ6}"
+
+
+def worker(db_path, boxes, block_size, start_evt, out_q):
+    from src.database import Database
+    from src.box_rules import BoxRuleEngine
+    db = Database(db_path)
+    engine = BoxRuleEngine(db, block_size=block_size)
+    product = {'id': 1, 'sn4': 'STRS'}
+    key = engine.counter_key(1, 1, 0)
+    start_evt.wait()
+    t0 = time.perf_counter()
+    out = []
+    for _ in range(boxes):
+        seq = engine.take_sequence(key)
+        box_no, _ = engine.generate_box_no(1, product, 0, seq)
+        out.append(box_no)
+    elapsed = time.perf_counter() - t0
+    engine.release_blocks()
+    db.close()
+    out_q.put((os.getpid(), elapsed, out))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--procs", type=int, default=4)
+    ap.add_argument("--boxes", type=int, default=2000, help="每个进程取号数量")
+    ap.add_argument("--block-size", type=int, default=1)
+    ap.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "stress_box_counter.db"))
+    args = ap.parse_args()
+
+    db = open_db(args.db)
+    db.cursor.execute("INSERT INTO box_rules (id, name, rule_string) VALUES (1, '压测', ?)", (RULE,))
+    db.conn.commit()
+    db.close()
+
+    start_evt = multiprocessing.Event()
+    out_q = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(args.db, args.boxes, args.block_size, start_evt, out_q))
+             for _ in range(args.procs)]
+    for p in procs: p.start()
+    time.sleep(0.5)
+    start_evt.set()
+    results = [out_q.get() for _ in procs]
+    for p in procs: p.join()
+
+    all_boxes = [b for _, _, boxes in results for b in boxes]
+    dup = [b for b, n in collections.Counter(all_boxes).items() if n > 1]
+    total_time = max(r[1] for r in results)
+    write_results("stress_box_counter", {
+        "procs": args.procs,
+        "boxes_per_proc": args.boxes,
+        "block_size": args.block_size,
+        "total_boxes": len(all_boxes),
+        "unique_boxes": len(set(all_boxes)),
+        "duplicates": dup[:20],
+        "boxes_per_second": round(len(all_boxes) / total_time, 1) if total_time else None,
+        "per_proc_seconds": [round(r[1], 3) for r in results],
+    })
+    if dup:
+        print(f"发现 {len(dup)} 个重复箱号！")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,24 @@
 import sys
+# 性能分析模式 (LABEL_PROFILE=1 或 --profile) 需在导入 PyQt 及程序模块之前开启
+from src import profiler
+profiler.enable_from_env()
+
 from PyQt5.QtWidgets import QApplication
 from src.ui.main_window import MainWindow
 
 def main():
-    app = QApplication(sys.argv)
+    with profiler.span("QApplication"):
+        app = QApplication(sys.argv)
     
     # 设置全局样式 (高对比度)
     app.setStyle("Fusion")
     
-    window = MainWindow()
-    window.show()
+    with profiler.span("MainWindow"):
+        window = MainWindow()
+    with profiler.span("window.show"):
+        window.show()
+        app.processEvents()
+    profiler.mark("窗口已显示")
     
     sys.exit(app.exec_())
 
@@ -1,23 +1,39 @@
-import win32com.client
 import os
-from src.database import Database
+from collections import OrderedDict
+from src.printer import PrinterBackend, DEFAULT_FORMAT_CACHE_SIZE
 
-class BartenderPrinter:
-    def __init__(self):
-        self.db = Database() # 初始化数据库连接
+class BartenderPrinter(PrinterBackend):
+    """BarTender COM 打印 (在打印线程内创建，不访问数据库；打印机等配置由调用方传入)"""
+    def __init__(self, cache_size=DEFAULT_FORMAT_CACHE_SIZE):
         self.bt_app = None
+        self.cache_size = max(1, int(cache_size or DEFAULT_FORMAT_CACHE_SIZE))
+        # 已打开模板的 LRU 缓存: 规范化路径 -> [format 对象, (mtime, size), {已写过的数据源名: 模板原值}]
+        self._formats = OrderedDict()
         try:
-            self.bt_app = win32com.client.Dispatch("BarTender.Application")
-            self.bt_app.Visible = False
+            self._dispatch()
         except Exception as e:
             print(f"Bartender Init Error: {e}")
 
+    def _dispatch(self):
+        # win32com 仅在 Windows 上可用，延迟到实际使用 BarTender 时再导入
+        import win32com.client
+        self.bt_app = win32com.client.Dispatch("BarTender.Application")
+        self.bt_app.Visible = False
+        self._formats.clear() # 旧实例的模板句柄已失效
+
+    def is_ready(self):
+        return self.bt_app is not None
+
+    def warm_up(self, template_path):
+        if not self.bt_app or not template_path or not os.path.exists(template_path): return
+        try: self._get_format(template_path)
+        except Exception as e: print(f"Bartender Warm-up Error: {e}")
+
     def print_label(self, template_path, data_map, printer_name=None):
         # 检查 Bartender 实例
         if not self.bt_app:
             try:
-                self.bt_app = win32com.client.Dispatch("BarTender.Application")
-                self.bt_app.Visible = False
+                self._dispatch()
             except:
                 return False, "Bartender未安装或无法启动"
 
@@ -26,22 +42,28 @@ class BartenderPrinter:
 
         bt_format = None
         try:
-            # --- 修复关键点 1: 保持以只读模式打开 ---
-            # Open(FileName, ReadOnly, Password)
-            # ReadOnly=True
-            bt_format = self.bt_app.Formats.Open(template_path, True, "")
+            # 从缓存获取已打开的模板 (连续打印同一模板时只打开一次)
+            bt_format = self._get_format(template_path)
             
             # --- 设置默认打印机 ---
-            target_printer = self.db.get_setting('default_printer')
+            target_printer = printer_name
             if target_printer and target_printer != "使用系统默认打印机":
                 bt_format.Printer = target_printer
 
             # --- 设置数据源 ---
             # data_map 包含: name, spec, code69, 1, 2, 3...
-            for key, value in data_map.items():
+            # 模板复用时上一箱写入的值会保留：首次写入某数据源前记下模板原值，
+            # 本次未提供的数据源恢复为原值，打印结果与新打开的模板一致
+            defaults = self._formats[self._cache_key(template_path)][2]
+            values = {k: str(v) for k, v in data_map.items()}
+            for key in defaults.keys() - values.keys():
+                values[key] = defaults[key]
+            for key, value in values.items():
                 try:
+                    if key not in defaults:
+                        defaults[key] = bt_format.GetNamedSubStringValue(key)
                     # 尝试设置命名数据源
-                    bt_format.SetNamedSubStringValue(key, str(value))
+                    bt_format.SetNamedSubStringValue(key, value)
                 except:
                     pass 
 
@@ -49,23 +71,56 @@ class BartenderPrinter:
             # PrintOut(ShowStatusWindow, ShowDialog)
             bt_format.PrintOut(False, False) 
             
+            # 模板保持打开，由缓存在淘汰 / 文件变更 / 退出时关闭
+            return True, "打印成功"
+        except Exception as e:
+            # 异常处理：关闭并移出缓存，防止锁死或复用损坏的句柄
+            self._close_format(template_path)
+            return False, f"打印出错: {str(e)}"
+
+    def _cache_key(self, template_path):
+        return os.path.normcase(os.path.abspath(template_path))
+
+    def _get_format(self, template_path):
+        """LRU 缓存取模板；.btw 文件的修改时间或大小变化时重新打开"""
+        key = self._cache_key(template_path)
+        st = os.stat(template_path)
+        sig = (st.st_mtime, st.st_size)
+        entry = self._formats.get(key)
+        if entry:
+            if entry[1] == sig:
+                self._formats.move_to_end(key)
+                return entry[0]
+            self._close_format(template_path) # 模板已被修改
+
+        # --- 修复关键点 1: 保持以只读模式打开 ---
+        # Open(FileName, ReadOnly, Password)
+        # ReadOnly=True
+        bt_format = self.bt_app.Formats.Open(template_path, True, "")
+        self._formats[key] = [bt_format, sig, {}]
+        while len(self._formats) > self.cache_size:
+            self._close_format(next(iter(self._formats)))
+        return bt_format
+
+    def _close_format(self, template_path):
+        entry = self._formats.pop(self._cache_key(template_path), None)
+        if not entry: return
+        try:
             # --- 修复关键点 2: 强制不保存 ---
             # CloseOptions 枚举: 
             # 0 = btSaveChanges (保存)
             # 1 = btDoNotSaveChanges (不保存) <--- 修改为 1
             # 2 = btPromptSaveChanges (询问)
-            bt_format.Close(1) 
-            
-            return True, "打印成功"
-        except Exception as e:
-            # 异常处理：尝试关闭模板防止锁死
-            try:
-                # 同样确保异常退出时也不保存
-                if bt_format: bt_format.Close(1)
-            except: pass
-            return False, f"打印出错: {str(e)}"
+            entry[0].Close(1)
+        except: pass
+
+    def close_formats(self):
+        """关闭所有缓存的模板"""
+        for key in list(self._formats):
+            self._close_format(key)
 
     def quit(self):
+        self.close_formats()
         if self.bt_app:
             try:
                 # --- 修复关键点 3: 退出程序时不保存 ---
@@ -1,10 +1,46 @@
 import datetime
+import heapq
 import re # 引入正则模块
 from src.database import Database
 
+# 箱号规则占位符: {SN4} / 日期编码 / {SEQn}
+_RULE_TOKENS = re.compile(r"\{(SN4|YYYY|Y2|Y1|MM|M1|DD|SEQ(\d+))\}")
+DATE_CODES = ("YYYY", "Y2", "Y1", "MM", "M1", "DD")
+# 默认每次预留的流水号数量 (设置项 box_seq_block_size)
+DEFAULT_BLOCK_SIZE = 1
+
+class SeqBlock:
+    """本工位已预留的一段流水号 [first, last]"""
+    __slots__ = ('first', 'last', 'next', 'returned')
+
+    def __init__(self, first, last):
+        self.first = first
+        self.last = last
+        self.next = first    # 下一个未发出的号
+        self.returned = []   # 打印失败退回的号 (最小堆，优先重新发出)
+
+    def peek(self):
+        if self.returned: return self.returned[0]
+        return self.next if self.next <= self.last else None
+
+
 class BoxRuleEngine:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, block_size=None):
         self.db = db
+        # 未指定时跟随设置 box_seq_block_size (设置页修改后下次预留号段即生效)
+        self._block_from_settings = block_size is None
+        if block_size is None: block_size = db.get_int_setting('box_seq_block_size', DEFAULT_BLOCK_SIZE)
+        self.block_size = max(1, block_size)
+        # 计数键 (产品, 规则, 年, 月, 批次) -> SeqBlock
+        self._blocks = {}
+        # 规则 ID -> 编译后的 str.format 模板 (None 表示规则不存在)
+        self._templates = {}
+        # 当天的日期编码 (按天预计算)
+        self._day = None
+        self._day_codes = {}
+        # 设置页修改 / 删除箱号规则时清除缓存
+        db.subscribe('box_rules', self.invalidate)
+        db.subscribe('settings', self.on_setting_changed)
 
     def parse_date_code(self, code, dt):
         """处理自定义日期编码"""
@@ -25,52 +61,116 @@ class BoxRuleEngine:
         
         return ""
 
-    def generate_box_no(self, rule_id, product_info, repair_level=0):
+    @staticmethod
+    def compile_rule(rule_fmt):
+        """
+        将规则字符串编译为 str.format 模板，例如
+        MZXH{SN4}{Y1}{M1}{SEQ5} -> MZXH{sn4}{Y1}{M1}{seq:05d}
+        规则中的其他花括号原样保留。
+        """
+        parts = []
+        pos = 0
+        for m in _RULE_TOKENS.finditer(rule_fmt):
+            parts.append(rule_fmt[pos:m.start()].replace("{", "{{").replace("}", "}}"))
+            code = m.group(1)
+            if code == "SN4": parts.append("{sn4}")
+            elif m.group(2) is not None: parts.append(f"{{seq:0{int(m.group(2))}d}}")
+            else: parts.append(f"{{{code}}}")
+            pos = m.end()
+        parts.append(rule_fmt[pos:].replace("{", "{{").replace("}", "}}"))
+        return "".join(parts)
+
+    def get_template(self, rule_id):
+        """取编译后的规则模板 (缓存)；规则不存在返回 None"""
+        if rule_id not in self._templates:
+            cursor = self.db.conn.cursor()
+            cursor.execute("SELECT rule_string FROM box_rules WHERE id=?", (rule_id,))
+            res = cursor.fetchone()
+            self._templates[rule_id] = self.compile_rule(res[0] or "") if res else None
+        return self._templates[rule_id]
+
+    def day_codes(self, dt):
+        """当天所有日期编码，跨天时重新计算"""
+        day = dt.date()
+        if day != self._day:
+            self._day_codes = {code: self.parse_date_code(code, dt) for code in DATE_CODES}
+            self._day = day
+        return self._day_codes
+
+    def invalidate(self, rule_id=None):
+        """清除规则模板缓存；rule_id 为空时全部清除"""
+        if rule_id is None:
+            self._templates.clear()
+            return
+        try: rule_id = int(rule_id)
+        except (TypeError, ValueError): pass
+        self._templates.pop(rule_id, None)
+
+    def on_setting_changed(self, key):
+        if key == 'box_seq_block_size' and self._block_from_settings:
+            self.block_size = max(1, self.db.get_int_setting(key, DEFAULT_BLOCK_SIZE))
+
+    @staticmethod
+    def counter_key(rule_id, product_id, repair_level=0, dt=None):
+        dt = dt or datetime.datetime.now()
+        return (product_id, rule_id, dt.year, dt.month, repair_level)
+
+    def peek_sequence(self, key):
+        """下一个将要发出的流水号 (不占用)"""
+        b = self._blocks.get(key)
+        seq = b.peek() if b else None
+        if seq is None: seq = self.db.get_box_counter(*key) + 1
+        return seq
+
+    def take_sequence(self, key):
+        """发出一个流水号；本地号段用完时向数据库原子预留下一段 (每段一次事务)"""
+        b = self._blocks.get(key)
+        if b is not None and b.returned: return heapq.heappop(b.returned)
+        if b is None or b.next > b.last:
+            first, last = self.db.reserve_box_block(*key, self.block_size)
+            b = self._blocks[key] = SeqBlock(first, last)
+        seq = b.next
+        b.next += 1
+        return seq
+
+    def return_sequence(self, key, seq):
+        """打印失败放弃的流水号退回本地号段，下次优先发出"""
+        b = self._blocks.get(key)
+        if b is not None and b.first <= seq <= b.last and seq not in b.returned:
+            heapq.heappush(b.returned, seq)
+
+    def release_blocks(self):
+        """退出时归还未发出的号段 (其他工位已在其后预留时无法归还，只留空号)"""
+        for key, b in list(self._blocks.items()):
+            keep = b.next - 1
+            returned = set(b.returned)
+            while keep >= b.first and keep in returned: keep -= 1
+            if keep < b.last:
+                try: self.db.release_box_block(*key, b.last, keep)
+                except Exception as e: print(f"Release Seq Error: {e}")
+        self._blocks.clear()
+
+    def generate_box_no(self, rule_id, product_info, repair_level=0, seq=None):
         """
         product_info: dict (must contain 'id', 'sn4')
+        seq: 已发出的流水号；为空时预览下一个号 (不占用)
         """
-        cursor = self.db.conn.cursor()
-        cursor.execute("SELECT rule_string FROM box_rules WHERE id=?", (rule_id,))
-        res = cursor.fetchone()
+        tmpl = self.get_template(rule_id)
         
         # 如果没有规则，返回默认
-        if not res: return "NO_RULE", 0
+        if tmpl is None: return "NO_RULE", 0
         
-        rule_fmt = res[0]
         now = datetime.datetime.now()
         
         # 1. 获取计数
-        # 预览时不自增，取 (当前值 + 1)
-        pid = product_info.get('id', 0)
-        current_seq = self.db.get_box_counter(pid, rule_id, now.year, now.month, repair_level)
-        next_seq = current_seq + 1
-        
-        # 2. 解析规则
-        result = rule_fmt
+        if seq is None:
+            pid = product_info.get('id', 0)
+            seq = self.peek_sequence(self.counter_key(rule_id, pid, repair_level, now))
         
-        # 替换基础变量
-        result = result.replace("{SN4}", str(product_info.get('sn4', '0000')))
-        
-        # 替换时间变量
-        for code in ["YYYY", "Y2", "Y1", "MM", "M1", "DD"]:
-            placeholder = f"{{{code}}}"
-            if placeholder in result:
-                result = result.replace(placeholder, self.parse_date_code(code, now))
-
-        # 3. 替换动态流水号 {SEQn}
-        # 使用正则查找所有 {SEQ数字} 的模式
-        def seq_replacer(match):
-            # 获取括号内的数字，例如 {SEQ3} -> 3
-            width = int(match.group(1))
-            # 格式化数字，例如 1 -> 001
-            return f"{next_seq:0{width}d}"
-
-        # 正则替换：匹配 {SEQ + 数字 + }
-        result = re.sub(r"\{SEQ(\d+)\}", seq_replacer, result)
-
-        return result, next_seq
+        # 2. 一次格式化生成箱号 (规则模板与日期编码均已预先计算)
+        result = tmpl.format(sn4=product_info.get('sn4', '0000'), seq=seq, **self.day_codes(now))
+        return result, seq
 
     def commit_sequence(self, rule_id, product_id, repair_level=0):
-        """打印成功后提交计数"""
-        now = datetime.datetime.now()
-        self.db.increment_box_counter(product_id, rule_id, now.year, now.month, repair_level)
+        """直接占用下一个流水号 (不经过预览 / 打印队列的调用方使用)"""
+        return self.take_sequence(self.counter_key(rule_id, product_id, repair_level))
@@ -1,16 +1,85 @@
 import sqlite3
 import json
+import zlib
+import re
 import shutil
 import os
 import datetime
+import calendar
+import time
+import threading
+from contextlib import contextmanager
 from src.config import DEFAULT_MAPPING
+from src.sn_filter import SnBloomFilter
+from src import profiler
+from src.metrics import PipelineMetrics, Histogram
+
+# 当前表结构版本 (保存在 PRAGMA user_version 中)
+SCHEMA_VERSION = 9
+# 数据库被其他实例锁定时的等待时间 (秒)
+BUSY_TIMEOUT = 10
+# UPSERT ... RETURNING 需要 SQLite 3.35+
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+# 流水线耗时统计保留天数
+METRICS_RETENTION_DAYS = 30
+# SN 过滤器检查其他工位新提交记录的最短间隔 (秒)；间隔内漏判的重复 SN 由 records.sn 唯一约束在写入时拒绝
+SN_FILTER_SYNC_INTERVAL = 2.0
 
 class Database:
-    def __init__(self, db_name='label_printer.db'):
+    # 版本升级步骤: (目标版本, 方法名)，按顺序执行
+    MIGRATIONS = [
+        (1, '_migrate_v1'),
+        (2, '_migrate_v2'),
+        (3, '_migrate_v3'),
+        (4, '_migrate_v4'),
+        (5, '_migrate_v5'),
+        (6, '_migrate_v6'),
+        (7, '_migrate_v7'),
+        (8, '_migrate_v8'),
+        (9, '_migrate_v9'),
+    ]
+    # 数据量大的升级步骤在结构变更后分批迁移数据: 版本 -> 方法名。
+    # 每批单独提交 (中断后下次启动从断点继续)，迁移完成前不执行后续版本
+    BACKFILLS = {6: '_backfill_v6'}
+    BACKFILL_BATCH = 50000
+
+    def __init__(self, db_name='label_printer.db', progress=None):
+        """
+        进程内唯一的数据库连接管理器 (由 MainWindow 创建并注入各页面)
+        conn: 写连接 (所有写操作、事务)
+        read_conn: 只读连接 (界面列表、历史查询等)，WAL 模式下读不阻塞写
+        progress: 升级进度回调 progress(说明, 已完成, 总数)，仅在需要分批迁移数据时调用
+        """
         self.db_name = os.path.abspath(db_name)
-        self.conn = sqlite3.connect(self.db_name)
+        self.progress = progress
+        self.conn = None
+        self.read_conn = None
+        self._connect()
+        # 已打印 SN 的内存过滤器 (由 load_sn_filter 加载，未加载时查重直接走数据库)
+        self.sn_filter = None
+        self._sn_filter_lock = threading.Lock()
+        self._sn_filter_loading = False
+        self._sn_filter_pending = []
+        # 变更通知: topic -> [回调]，用于各页面缓存失效 (规则、设置等)
+        self._listeners = {}
+        # 升级过程中需要提示操作员的事项 (由主窗口显示)
+        self.notices = []
+        # 设置缓存 (key -> 原始值) 及解析结果，首次 get_setting 时载入
+        self._settings = None
+        self._settings_parsed = {}
+        # 装箱流水线各阶段耗时 (内存滚动统计，定期由 flush_metrics 写入 metrics 表)
+        self.metrics = PipelineMetrics()
+        with profiler.span("Database.setup_db"):
+            self.setup_db()
+        # SN/箱号全文索引 (FTS5 trigram) 是否可用，不可用时历史搜索退化为 LIKE
+        self.has_fts = self._table_exists('records_fts')
+
+    def _connect(self):
+        self.conn = sqlite3.connect(self.db_name, timeout=BUSY_TIMEOUT)
         self.cursor = self.conn.cursor()
-        self.setup_db()
+        try: self.conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.DatabaseError: pass # 只读介质等情况保持默认日志模式
+        self.read_conn = sqlite3.connect(f"file:{self.db_name}?mode=ro", uri=True, timeout=BUSY_TIMEOUT)
 
     def setup_db(self):
         # 表结构定义 (保持现有结构，只做检查)
@@ -49,6 +118,9 @@ class Database:
         self._check_and_add_column('products', 'rule_id', 'INTEGER DEFAULT 0')
         self._check_and_add_column('products', 'sn_rule_id', 'INTEGER DEFAULT 0')
         self._check_and_add_column('box_rules', 'rule_string', 'TEXT')
+
+        # 版本化升级 (索引、约束等)
+        self._migrate()
         
         # 初始化默认设置
         default_mapping_json = json.dumps(DEFAULT_MAPPING)
@@ -61,6 +133,306 @@ class Database:
         
         self.conn.commit()
 
+    def _migrate(self):
+        """按 user_version 逐级执行升级步骤，每一步在单独的事务中完成 (失败则整步回滚)"""
+        self.cursor.execute("PRAGMA user_version")
+        ver = self.cursor.fetchone()[0]
+        for target, method in self.MIGRATIONS:
+            if ver < target:
+                with self.immediate():
+                    getattr(self, method)()
+                    self.cursor.execute(f"PRAGMA user_version = {int(target)}")
+                ver = target
+            backfill = self.BACKFILLS.get(target)
+            if backfill: getattr(self, backfill)()
+
+    def _migrate_v1(self):
+        """v1: 为扫码查重、按箱号重打、今日统计建立索引"""
+        # SN 唯一约束：由数据库兜底防止重复打印
+        self._create_sn_unique()
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_records_box_no ON records(box_no)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_records_name_date ON records(name, print_date)")
+
+    def _migrate_v2(self):
+        """v2: 箱号计数器由字符串键 P{pid}_R{rid}_{y}_{m}_{r} 改为复合整数主键 (WITHOUT ROWID)"""
+        self.cursor.execute('''
+            CREATE TABLE box_counters_v2 (
+                product_id INTEGER NOT NULL, rule_id INTEGER NOT NULL,
+                year INTEGER NOT NULL, month INTEGER NOT NULL, repair_level INTEGER NOT NULL,
+                current_val INTEGER NOT NULL,
+                PRIMARY KEY (product_id, rule_id, year, month, repair_level)
+            ) WITHOUT ROWID
+        ''')
+        key_re = re.compile(r"^P(\w+)_R(\w+)_(\d+)_(\d+)_(\d+)$")
+        self.cursor.execute("SELECT key, current_val FROM box_counters")
+        rows = []
+        for key, val in self.cursor.fetchall():
+            m = key_re.match(key or "")
+            if not m or val is None:
+                print(f"Migrate v2: 跳过无法识别的计数键 {key}")
+                continue
+            pid, rid = (int(x) if x.lstrip('-').isdigit() else 0 for x in m.group(1, 2))
+            rows.append((pid, rid, int(m.group(3)), int(m.group(4)), int(m.group(5)), val))
+        # 同一复合键出现多次 (如 PNone 与 P0) 时取最大值，保证不回退
+        self.cursor.executemany('''INSERT INTO box_counters_v2 VALUES (?,?,?,?,?,?)
+                                   ON CONFLICT (product_id, rule_id, year, month, repair_level)
+                                   DO UPDATE SET current_val = MAX(current_val, excluded.current_val)''', rows)
+        self.cursor.execute("DROP TABLE box_counters")
+        self.cursor.execute("ALTER TABLE box_counters_v2 RENAME TO box_counters")
+
+    def _migrate_v3(self):
+        """v3: 为历史搜索建立 SN/箱号的 FTS5 trigram 影子索引，由触发器与 records 同步"""
+        try:
+            self.cursor.execute('''
+                CREATE VIRTUAL TABLE records_fts USING fts5(
+                    sn, box_no, content='records', content_rowid='id', tokenize='trigram')
+            ''')
+        except sqlite3.OperationalError as e:
+            # SQLite 过旧 (< 3.34) 或未编译 FTS5 时跳过，搜索继续使用 LIKE
+            print(f"Migrate v3: 无法创建全文索引，历史搜索使用 LIKE ({e})")
+            return
+        self.cursor.execute('''
+            CREATE TRIGGER records_fts_ai AFTER INSERT ON records BEGIN
+                INSERT INTO records_fts(rowid, sn, box_no) VALUES (new.id, new.sn, new.box_no);
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER records_fts_ad AFTER DELETE ON records BEGIN
+                INSERT INTO records_fts(records_fts, rowid, sn, box_no) VALUES ('delete', old.id, old.sn, old.box_no);
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER records_fts_au AFTER UPDATE OF sn, box_no ON records BEGIN
+                INSERT INTO records_fts(records_fts, rowid, sn, box_no) VALUES ('delete', old.id, old.sn, old.box_no);
+                INSERT INTO records_fts(rowid, sn, box_no) VALUES (new.id, new.sn, new.box_no);
+            END
+        ''')
+        # 回填已有记录
+        self.cursor.execute("INSERT INTO records_fts(records_fts) VALUES ('rebuild')")
+
+    def _migrate_v4(self):
+        """v4: 每日装箱数汇总表 (产品名称, 日期 YYYYMMDD)，随记录写入/删除同步维护"""
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_box_stats (
+                name TEXT NOT NULL, day INTEGER NOT NULL, boxes INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (name, day)
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute('''
+            INSERT INTO daily_box_stats (name, day, boxes)
+            SELECT name, CAST(replace(substr(print_date, 1, 10), '-', '') AS INTEGER), COUNT(DISTINCT box_no)
+            FROM records WHERE name IS NOT NULL AND print_date IS NOT NULL
+            GROUP BY 1, 2
+        ''')
+
+    def _migrate_v5(self):
+        """v5: 打印时间改用整数列 print_ts (秒) 与 print_day (YYYYMMDD)，日期范围查询走索引"""
+        self._check_and_add_column('records', 'print_ts', 'INTEGER')
+        self._check_and_add_column('records', 'print_day', 'INTEGER')
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_records_ts ON records(print_ts)")
+        # 今日统计已改由 daily_box_stats 提供，(name, print_date) 索引不再使用
+        self.cursor.execute("DROP INDEX IF EXISTS idx_records_name_date")
+        # 已有数据在 v6 拆分 boxes 表时一并换算
+
+    # v6 迁移期间的归箱键 (箱号, 产品名称, 打印日期)；无日期编码的规则每月重新计数，箱号会跨月重复
+    V6_DAY = "COALESCE(r.print_day, CAST(strftime('%Y%m%d', r.print_date) AS INTEGER), 0)"
+
+    def _migrate_v6(self):
+        """
+        v6: 拆出箱表 boxes (箱号、产品快照、打印时间、批次、数量)，records 只保留 (id, box_id, seq, sn)。
+        本步骤只变更结构：原表改名为 records_legacy，数据由 _backfill_v6 分批迁移；
+        记录 id 保持不变，历史查询与导出通过视图 record_view 读取。
+        """
+        c = self.cursor
+        if self.progress and c.execute("SELECT 1 FROM records LIMIT 1").fetchone():
+            self.progress("正在升级数据库 (拆分箱表)...", 0, 0)
+        # 旧表上的全文索引、防重触发器与索引随旧表保留会占用新表要用的名称，先删除
+        for t in ('records_fts_ai', 'records_fts_ad', 'records_fts_au', 'records_sn_no_dup_ai', 'records_sn_no_dup_au'):
+            c.execute(f"DROP TRIGGER IF EXISTS {t}")
+        for i in ('idx_records_sn', 'idx_records_box_no', 'idx_records_ts'):
+            c.execute(f"DROP INDEX IF EXISTS {i}")
+        had_fts = self._table_exists('records_fts')
+        c.execute("DROP TABLE IF EXISTS records_fts")
+        c.execute("ALTER TABLE records RENAME TO records_legacy")
+        c.execute('''
+            CREATE TABLE boxes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                box_no TEXT NOT NULL, product_id INTEGER,
+                name TEXT, spec TEXT, model TEXT, color TEXT, code69 TEXT,
+                print_ts INTEGER NOT NULL, print_day INTEGER NOT NULL,
+                repair_level INTEGER NOT NULL DEFAULT 0, qty INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                box_id INTEGER NOT NULL REFERENCES boxes(id), seq INTEGER, sn TEXT
+            )
+        ''')
+        # 迁移期间按归箱键查找已建的箱，迁移完成后换成 box_no 单列索引
+        c.execute("CREATE INDEX idx_boxes_migrate ON boxes(box_no, name, print_day)")
+        c.execute("CREATE INDEX idx_records_box ON records(box_id, seq)")
+        c.execute('''
+            CREATE VIEW record_view AS
+            SELECT r.id, b.box_no, r.seq AS box_sn_seq, b.name, b.spec, b.model, b.color, r.sn, b.code69,
+                   b.print_day, b.print_ts, r.box_id
+            FROM records r JOIN boxes b ON b.id = r.box_id
+        ''')
+        # 新表为空时建立全文索引，迁移写入时由触发器同步，无需最后整体重建
+        if had_fts: self._create_fts()
+
+    def _backfill_v6(self):
+        """按 id 分批把 records_legacy 迁入 boxes / records，每批一个事务；全部迁完后建立约束并删除旧表"""
+        if not self._table_exists('records_legacy'): return
+        lo, hi = self.conn.execute("SELECT MIN(id), MAX(id) FROM records_legacy").fetchone()
+        c = self.cursor
+        # 产品名称 -> 产品 id (products.name 无索引，避免逐箱子查询)；临时表只在本连接可见，每次启动重建
+        c.execute("DROP TABLE IF EXISTS temp.migrate_product_ids")
+        c.execute("CREATE TEMP TABLE migrate_product_ids (name TEXT PRIMARY KEY, id INTEGER)")
+        c.execute("INSERT INTO migrate_product_ids SELECT name, MIN(id) FROM products WHERE name IS NOT NULL GROUP BY name")
+        c.execute("DROP TABLE IF EXISTS temp.migrate_batch")
+        c.execute('''
+            CREATE TEMP TABLE migrate_batch (
+                box_no TEXT, name TEXT, day INTEGER, first_id INTEGER, ts INTEGER, cnt INTEGER,
+                product_id INTEGER, spec TEXT, model TEXT, color TEXT, code69 TEXT
+            )
+        ''')
+        self.conn.commit()
+        day = self.V6_DAY
+        same_box = "b.box_no = t.box_no AND b.name IS t.name AND b.print_day = t.day"
+        of_box = "t.box_no = boxes.box_no AND t.name IS boxes.name AND t.day = boxes.print_day"
+        pos = lo
+        while lo is not None:
+            with self.immediate() as cur:
+                # 断点取自已迁移的最大 id (同一事务内读取，多个程序实例同时升级也不会重复迁移)；
+                # pos 为本次已处理到的位置，从其后第一条旧记录开始 (跳过 id 空档)
+                done = cur.execute("SELECT MAX(id) FROM records").fetchone()[0]
+                start = pos if done is None else max(pos, done + 1)
+                start = cur.execute("SELECT MIN(id) FROM records_legacy WHERE id >= ?", (start,)).fetchone()[0]
+                if start is None: break
+                end = pos = start + self.BACKFILL_BATCH
+                cur.execute(f'''
+                    INSERT INTO migrate_batch
+                    SELECT COALESCE(r.box_no, ''), r.name, {day}, MIN(r.id),
+                           MIN(COALESCE(r.print_ts, CAST(strftime('%s', r.print_date) AS INTEGER), 0)), COUNT(*),
+                           MIN(p.id), MIN(r.spec), MIN(r.model), MIN(r.color), MIN(r.code69)
+                    FROM records_legacy r LEFT JOIN migrate_product_ids p ON p.name = r.name
+                    WHERE r.id >= ? AND r.id < ?
+                    GROUP BY COALESCE(r.box_no, ''), r.name, {day}
+                ''', (start, end))
+                # 跨批次的箱 (前一批已建) 累加数量；其余新建，箱 id 按首条记录顺序分配
+                cur.execute(f'''
+                    UPDATE boxes SET
+                        qty = qty + (SELECT t.cnt FROM migrate_batch t WHERE {of_box}),
+                        print_ts = MIN(print_ts, (SELECT t.ts FROM migrate_batch t WHERE {of_box}))
+                    WHERE id IN (SELECT b.id FROM migrate_batch t JOIN boxes b ON {same_box})
+                ''')
+                cur.execute(f'''
+                    INSERT INTO boxes (box_no, product_id, name, spec, model, color, code69, print_ts, print_day, qty)
+                    SELECT t.box_no, t.product_id, t.name, t.spec, t.model, t.color, t.code69, t.ts, t.day, t.cnt
+                    FROM migrate_batch t WHERE NOT EXISTS (SELECT 1 FROM boxes b WHERE {same_box})
+                    ORDER BY t.first_id
+                ''')
+                cur.execute(f'''
+                    INSERT INTO records (id, box_id, seq, sn)
+                    SELECT r.id, b.id, r.box_sn_seq, r.sn FROM records_legacy r
+                    JOIN boxes b ON b.box_no = COALESCE(r.box_no, '') AND b.name IS r.name AND b.print_day = {day}
+                    WHERE r.id >= ? AND r.id < ?
+                ''', (start, end))
+                cur.execute("DELETE FROM migrate_batch")
+            if self.progress: self.progress("正在升级数据库 (拆分箱表)...", min(end, hi + 1) - lo, hi + 1 - lo)
+        if self.progress and lo is not None: self.progress("正在建立索引...", 1, 1)
+        with self.immediate() as cur:
+            if not self._table_exists('records_legacy'): return
+            cur.execute("DROP TABLE records_legacy")
+            cur.execute("DROP INDEX idx_boxes_migrate")
+            cur.execute("CREATE INDEX idx_boxes_box_no ON boxes(box_no)")
+            cur.execute("CREATE INDEX idx_boxes_ts ON boxes(print_ts)")
+            self._create_sn_unique()
+            self._rebuild_daily_stats(cur)
+        c.execute("DROP TABLE IF EXISTS temp.migrate_product_ids")
+        c.execute("DROP TABLE IF EXISTS temp.migrate_batch")
+        if lo is not None:
+            self.notices.append("打印记录已升级为新的存储结构。旧数据占用的空间可在 设置 → 系统维护 中点击“整理数据库”回收 (耗时较长，建议空闲时执行)。")
+
+    def _migrate_v7(self):
+        """v7: 保存每箱实际发送给打印机的模板路径与数据 (zlib 压缩的 JSON)，补打直接读取"""
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS box_payloads (
+                box_id INTEGER PRIMARY KEY REFERENCES boxes(id),
+                template_path TEXT, data BLOB NOT NULL
+            )
+        ''')
+
+    def _migrate_v8(self):
+        """v8: 流水线各阶段耗时，每个时间片每阶段一行，buckets 为直方图桶计数 (JSON)"""
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS metrics (
+                ts INTEGER NOT NULL, stage TEXT NOT NULL,
+                count INTEGER NOT NULL, total_ms REAL NOT NULL, max_ms REAL NOT NULL, buckets TEXT NOT NULL
+            )
+        ''')
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_metrics_ts ON metrics(ts)")
+
+    def _migrate_v9(self):
+        """v9: 早期升级时因历史重复 SN 退化为普通索引的库，重新建立唯一约束或防重触发器"""
+        row = self.cursor.execute("SELECT sql FROM sqlite_master WHERE type='index' AND name='idx_records_sn'").fetchone()
+        if row and row[0] and row[0].upper().startswith("CREATE UNIQUE"): return
+        if self._table_exists('records_sn_no_dup_ai'): return
+        self.cursor.execute("DROP INDEX IF EXISTS idx_records_sn")
+        self._create_sn_unique()
+
+    def _create_sn_unique(self):
+        """
+        SN 唯一索引；历史数据已有重复 SN 时改建普通索引 + BEFORE INSERT/UPDATE 触发器，
+        新写入的重复 SN 同样以 IntegrityError 拒绝，已有的重复记录保留并提示操作员。
+        """
+        c = self.cursor
+        try:
+            c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_records_sn ON records(sn)")
+            return
+        except sqlite3.IntegrityError:
+            pass
+        c.execute("CREATE INDEX IF NOT EXISTS idx_records_sn ON records(sn)")
+        for event, when in (("INSERT", "ai"), ("UPDATE OF sn", "au")):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS records_sn_no_dup_{when} BEFORE {event} ON records
+                WHEN NEW.sn IS NOT NULL AND EXISTS (SELECT 1 FROM records WHERE sn = NEW.sn AND id IS NOT NEW.id)
+                BEGIN SELECT RAISE(ABORT, 'UNIQUE constraint failed: records.sn'); END
+            ''')
+        n = c.execute("SELECT COUNT(*) FROM (SELECT sn FROM records WHERE sn IS NOT NULL GROUP BY sn HAVING COUNT(*) > 1)").fetchone()[0]
+        msg = (f"历史打印记录中有 {n} 个SN重复出现 (升级前已存在)。\n"
+               "这些记录已保留，可在“打印记录”中搜索核对；之后再打印重复SN会被数据库拒绝。")
+        if msg not in self.notices: self.notices.append(msg)
+
+    def _create_fts(self):
+        """SN 与箱号的 FTS5 trigram 影子索引 (分别建在 records / boxes 上)，由触发器同步"""
+        c = self.cursor
+        c.execute("CREATE VIRTUAL TABLE records_fts USING fts5(sn, content='records', content_rowid='id', tokenize='trigram')")
+        c.execute("CREATE VIRTUAL TABLE boxes_fts USING fts5(box_no, content='boxes', content_rowid='id', tokenize='trigram')")
+        for table, col in (('records', 'sn'), ('boxes', 'box_no')):
+            c.execute(f'''
+                CREATE TRIGGER {table}_fts_ai AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {table}_fts(rowid, {col}) VALUES (new.id, new.{col});
+                END
+            ''')
+            c.execute(f'''
+                CREATE TRIGGER {table}_fts_ad AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {table}_fts({table}_fts, rowid, {col}) VALUES ('delete', old.id, old.{col});
+                END
+            ''')
+            c.execute(f'''
+                CREATE TRIGGER {table}_fts_au AFTER UPDATE OF {col} ON {table} BEGIN
+                    INSERT INTO {table}_fts({table}_fts, rowid, {col}) VALUES ('delete', old.id, old.{col});
+                    INSERT INTO {table}_fts(rowid, {col}) VALUES (new.id, new.{col});
+                END
+            ''')
+            c.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+
+    def _table_exists(self, name):
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name=?", (name,))
+        return self.cursor.fetchone() is not None
+
     def _check_and_add_column(self, table_name, column_name, column_type):
         try:
             self.cursor.execute(f"PRAGMA table_info({table_name})")
@@ -68,17 +440,54 @@ class Database:
                 self.cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
         except: pass
 
+    def subscribe(self, topic, callback):
+        """订阅变更通知，callback(key) 在 notify 时被调用"""
+        self._listeners.setdefault(topic, []).append(callback)
+
+    def notify(self, topic, key=None):
+        """广播变更 (如 'sn_rules' / 'box_rules')，key 为空表示全部失效"""
+        for cb in list(self._listeners.get(topic, [])):
+            try: cb(key)
+            except Exception as e: print(f"Notify Error ({topic}): {e}")
+
+    # --- 设置：首次读取时整表载入内存，之后读操作不再查库；写入时同步更新缓存并广播 'settings' ---
+    def _load_settings(self):
+        self._settings = dict(self.conn.execute("SELECT key, value FROM settings").fetchall())
+        self._settings_parsed = {}
+
     def get_setting(self, key):
-        self.cursor.execute("SELECT value FROM settings WHERE key=?", (key,))
-        r = self.cursor.fetchone()
-        if r and key == 'field_mapping':
-            try: return json.loads(r[0])
-            except: return DEFAULT_MAPPING
-        return r[0] if r else None
+        if self._settings is None: self._load_settings()
+        if key not in self._settings: return None
+        if key == 'field_mapping':
+            m = self._settings_parsed.get(key)
+            if m is None:
+                try: m = json.loads(self._settings[key])
+                except: m = DEFAULT_MAPPING
+                self._settings_parsed[key] = m
+            return dict(m) # 返回副本，调用方修改不影响缓存
+        return self._settings[key]
+
+    def get_int_setting(self, key, default=0):
+        """整数设置，未设置或格式错误时返回 default"""
+        v = self.get_setting(key)
+        try: return int(v) if v not in (None, "") else default
+        except (TypeError, ValueError): return default
 
     def set_setting(self, key, value):
         self.cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
         self.conn.commit()
+        if self._settings is not None:
+            self._settings[key] = value
+            self._settings_parsed.pop(key, None)
+        self.notify('settings', key)
+
+    def vacuum(self):
+        """整理数据库文件，回收升级 / 删除后的空闲空间 (耗时较长且独占数据库，由操作员手动执行)"""
+        try:
+            self.conn.commit()
+            self.conn.execute("VACUUM")
+            return True, "数据库整理完成"
+        except Exception as e: return False, str(e)
 
     def backup_db(self, custom_path=None):
         try:
@@ -86,41 +495,328 @@ class Database:
             if not os.path.exists(td): os.makedirs(td)
             ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             f = os.path.join(td, f"backup_{ts}.db")
-            self.conn.commit(); shutil.copy2(self.db_name, f)
+            self.conn.commit()
+            # WAL 模式下先把日志合并回主文件，再复制
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            shutil.copy2(self.db_name, f)
             return True, f"备份成功: {f}"
         except Exception as e: return False, str(e)
 
     def restore_db(self, path):
         try:
             if not os.path.exists(path): return False, "文件不存在"
-            self.conn.close()
+            self.close()
             try: shutil.move(self.db_name, self.db_name+".old")
             except: pass
+            # 清理旧库残留的 WAL 文件，避免套用到恢复后的数据库上
+            for suffix in ("-wal", "-shm"):
+                try: os.remove(self.db_name + suffix)
+                except OSError: pass
             shutil.copy2(path, self.db_name)
-            self.conn = sqlite3.connect(self.db_name); self.cursor = self.conn.cursor()
+            self._connect()
+            self._settings = None
             return True, "恢复成功，请重启"
         except Exception as e: return False, str(e)
 
     def check_sn_exists(self, sn):
+        f = self.sn_filter
+        # 共享数据库时其他工位可能刚打印过该 SN：按间隔检查外部提交并把新增记录补入过滤器
+        if f is not None:
+            now = time.monotonic()
+            if now - f.synced_at >= SN_FILTER_SYNC_INTERVAL:
+                f.synced_at = now
+                self._sn_filter_catch_up(f)
+        # 过滤器判定不存在即可确定未打印，无需查询数据库
+        if f is not None and not f.might_contain(sn): return False
         self.cursor.execute("SELECT id FROM records WHERE sn=?", (sn,))
-        return self.cursor.fetchone() is not None
+        exists = self.cursor.fetchone() is not None
+        if f is not None: f.record_db_result(exists)
+        return exists
+
+    # --- SN 过滤器 ---
+    def _sn_filter_catch_up(self, f):
+        """
+        PRAGMA data_version 只在其他连接 (含其他程序实例) 提交后变化；
+        变化时把 id 大于已载入最大 id 的记录补入过滤器 (本进程写入的记录会被重复加入，无影响)。
+        """
+        ver = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if ver == f.data_version: return
+        rows = self.conn.execute("SELECT id, sn FROM records WHERE id > ? ORDER BY id", (f.last_id,)).fetchall()
+        with self._sn_filter_lock:
+            for _, sn in rows:
+                if sn: f.add(sn)
+            if rows: f.last_id = max(f.last_id, rows[-1][0])
+            f.data_version = ver
+
+    def load_sn_filter(self, background=True):
+        """加载全部已打印 SN 到布隆过滤器；后台加载期间新增的 SN 暂存，加载完成后补入"""
+        with self._sn_filter_lock:
+            if self._sn_filter_loading: return
+            self._sn_filter_loading = True
+            self._sn_filter_pending = []
+        if background:
+            threading.Thread(target=self._build_sn_filter, name="sn-filter", daemon=True).start()
+        else:
+            self._build_sn_filter()
+
+    def _build_sn_filter(self):
+        f = None
+        try:
+            # 使用独立连接，避免与界面线程共享 sqlite3 连接
+            conn = sqlite3.connect(self.db_name)
+            try:
+                n = conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+                # 预留一倍余量，多年历史也无需频繁重建
+                f = SnBloomFilter(capacity=n * 2)
+                for rid, sn in conn.execute("SELECT id, sn FROM records"):
+                    if sn: f.add(sn)
+                    if rid > f.last_id: f.last_id = rid
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"SN Filter Load Error: {e}")
+        with self._sn_filter_lock:
+            if f is not None:
+                for sn in self._sn_filter_pending: f.add(sn)
+                self.sn_filter = f
+            self._sn_filter_pending = []
+            self._sn_filter_loading = False
+
+    def _sn_filter_update(self, added=(), removed=()):
+        with self._sn_filter_lock:
+            if self._sn_filter_loading: self._sn_filter_pending.extend(added)
+            f = self.sn_filter
+            if f is None: return
+            for sn in added: f.add(sn)
+            for sn in removed: f.discard(sn)
+            rebuild = f.needs_rebuild() and not self._sn_filter_loading
+        if rebuild: self.load_sn_filter()
+
+    def sn_filter_stats(self):
+        """过滤器内存占用与命中统计 (未加载时返回 None)"""
+        f = self.sn_filter
+        if f is None: return None
+        st = f.stats()
+        st['loading'] = self._sn_filter_loading
+        return st
+
+    # --- 打印记录写入 / 删除 (统一入口，保证过滤器同步) ---
+    def save_box_records(self, box_no, product, sn_list, print_date, repair_level=0, payload=None):
+        """
+        写入一整箱 (箱表一行 + 每个 SN 一行) 并提交，同一事务内更新每日装箱数；SN 重复时整箱回滚并抛出 sqlite3.IntegrityError
+        payload: (模板路径, 打印数据 dict)，保存后补打可原样重发
+        """
+        p = product
+        ts, day = self.to_ts(print_date), self.day_key(print_date)
+        with self.immediate() as cur:
+            cur.execute("""INSERT INTO boxes (box_no, product_id, name, spec, model, color, code69, print_ts, print_day, repair_level, qty)
+                           VALUES (?,?,?,?,?,?,?,?,?,?,?)""",
+                        (box_no, p.get('id'), p['name'], p['spec'], p['model'], p['color'], p['code69'],
+                         ts, day, int(repair_level or 0), len(sn_list)))
+            box_id = cur.lastrowid
+            cur.executemany("INSERT INTO records (box_id, seq, sn) VALUES (?,?,?)",
+                            [(box_id, i+1, sn) for i, sn in enumerate(sn_list)])
+            cur.execute("""INSERT INTO daily_box_stats (name, day, boxes) VALUES (?, ?, 1)
+                           ON CONFLICT (name, day) DO UPDATE SET boxes = boxes + 1""", (p['name'], day))
+            if payload:
+                cur.execute("INSERT INTO box_payloads (box_id, template_path, data) VALUES (?,?,?)",
+                            (box_id, payload[0], self._pack_payload(payload[1])))
+        self._sn_filter_update(added=list(sn_list))
+        return box_id
+
+    def delete_records(self, ids):
+        """按 ID 删除打印记录 (整箱删空时删除箱并扣减每日装箱数)，返回删除条数"""
+        if not ids: return 0
+        p = ",".join("?" * len(ids))
+        with self.immediate() as cur:
+            cur.execute(f"SELECT sn, box_id FROM records WHERE id IN ({p})", ids)
+            rows = cur.fetchall()
+            cur.execute(f"DELETE FROM records WHERE id IN ({p})", ids)
+            for box_id in {r[1] for r in rows}:
+                cur.execute("SELECT COUNT(*) FROM records WHERE box_id=?", (box_id,))
+                left = cur.fetchone()[0]
+                if left:
+                    cur.execute("UPDATE boxes SET qty=? WHERE id=?", (left, box_id))
+                    continue
+                cur.execute("SELECT name, print_day FROM boxes WHERE id=?", (box_id,))
+                box = cur.fetchone()
+                cur.execute("DELETE FROM boxes WHERE id=?", (box_id,))
+                cur.execute("DELETE FROM box_payloads WHERE box_id=?", (box_id,))
+                if box:
+                    cur.execute("UPDATE daily_box_stats SET boxes = MAX(boxes - 1, 0) WHERE name=? AND day=?", box)
+        self._sn_filter_update(removed=[r[0] for r in rows])
+        return len(rows)
+
+    @staticmethod
+    def _pack_payload(data_map):
+        return zlib.compress(json.dumps(data_map, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    def get_box_payload(self, box_id):
+        """读取某箱打印时的 (模板路径, 打印数据)；旧箱未保存时返回 None"""
+        row = self.read_conn.execute("SELECT template_path, data FROM box_payloads WHERE box_id=?", (box_id,)).fetchone()
+        if not row: return None
+        return row[0], json.loads(zlib.decompress(row[1]).decode('utf-8'))
+
+    # --- 打印时间：print_ts 为本地时间按 UTC 换算的秒数 (与 SQLite strftime('%s') 一致)，print_day 为 YYYYMMDD ---
+    TIME_FMT = "%Y-%m-%d %H:%M:%S"
+
+    @classmethod
+    def to_ts(cls, print_date):
+        """'2024-01-31 08:00:00' -> 1706688000"""
+        return calendar.timegm(time.strptime(str(print_date)[:19], cls.TIME_FMT))
+
+    @staticmethod
+    def day_key(print_date):
+        """'2024-01-31 08:00:00' -> 20240131"""
+        try: return int(str(print_date)[:10].replace("-", ""))
+        except ValueError: return 0
+
+    # --- 每日装箱数汇总 ---
+
+    def get_daily_boxes(self, name, day=None):
+        """某产品某日 (默认今天) 的装箱数，主键查询"""
+        if day is None: day = int(datetime.datetime.now().strftime("%Y%m%d"))
+        row = self.read_conn.execute("SELECT boxes FROM daily_box_stats WHERE name=? AND day=?", (name, day)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _rebuild_daily_stats(cur):
+        cur.execute("DELETE FROM daily_box_stats")
+        cur.execute("""
+            INSERT INTO daily_box_stats (name, day, boxes)
+            SELECT name, print_day, COUNT(*) FROM boxes WHERE name IS NOT NULL GROUP BY name, print_day
+        """)
+
+    def rebuild_daily_stats(self):
+        """按现有记录重新统计每日装箱数"""
+        with self.immediate() as cur:
+            self._rebuild_daily_stats(cur)
+
+    # --- 流水线耗时统计 ---
+    def flush_metrics(self):
+        """把内存中当前时间片的耗时统计写入 metrics 表，并清理过期数据"""
+        part = self.metrics.rotate()
+        if part is None: return 0
+        ts, hists = part
+        rows = [(ts, stage, h.count, h.total, h.max, json.dumps(h.buckets)) for stage, h in hists.items()]
+        with self.immediate() as cur:
+            cur.executemany("INSERT INTO metrics (ts, stage, count, total_ms, max_ms, buckets) "
+                            "VALUES (?,?,?,?,?,?)", rows)
+            cur.execute("DELETE FROM metrics WHERE ts < ?", (ts - METRICS_RETENTION_DAYS * 86400,))
+        return len(rows)
+
+    def load_metrics(self, since_ts):
+        """读取 since_ts 之后已写库的耗时统计，返回 ({阶段: 合并后的 Histogram}, 整箱数)"""
+        out = {}
+        for stage, count, total, max_ms, buckets in self.read_conn.execute(
+                "SELECT stage, count, total_ms, max_ms, buckets FROM metrics WHERE ts >= ?", (since_ts,)):
+            b = {int(k): v for k, v in json.loads(buckets).items()}
+            out.setdefault(stage, Histogram()).merge(Histogram(count, total, max_ms, b))
+        boxes = out["box_total"].count if "box_total" in out else 0
+        return out, boxes
+
+    # --- 打印记录查询：界面表格、导出、基准测试共用同一套过滤条件 ---
+    # 前 10 列为表格显示列，box_id 供补打定位整箱
+    HISTORY_COLUMNS = "id, box_no, box_sn_seq, name, spec, model, color, sn, code69, print_day, box_id"
+
+    # trigram 分词最短可检索 3 个字符，更短的关键字只能用 LIKE
+    FTS_MIN_KEYWORD = 3
+
+    def history_filter(self, keyword="", start_date=None, end_date=None):
+        """构造历史记录过滤条件，返回 (where, params)；日期为 yyyy-MM-dd 字符串"""
+        if not keyword:
+            where, params = "1=1", []
+        elif self.has_fts and len(keyword) >= self.FTS_MIN_KEYWORD:
+            # 作为短语检索 (双引号转义)，匹配 SN 或箱号中的任意子串
+            phrase = '"' + keyword.replace('"', '""') + '"'
+            where = ("(id IN (SELECT rowid FROM records_fts WHERE records_fts MATCH ?)"
+                     " OR box_id IN (SELECT rowid FROM boxes_fts WHERE boxes_fts MATCH ?))")
+            params = [phrase, phrase]
+        else:
+            kw = f"%{keyword}%"
+            where, params = "(sn LIKE ? OR box_no LIKE ?)", [kw, kw]
+        if start_date and end_date:
+            # 按 print_ts 索引做范围扫描：[开始日 0 点, 结束日次日 0 点)
+            where += " AND print_ts >= ? AND print_ts < ?"
+            params += [self.to_ts(f"{start_date} 00:00:00"), self.to_ts(f"{end_date} 00:00:00") + 86400]
+        return where, params
+
+    def open_reader(self):
+        """新建只读连接，供后台线程 (导出等) 独立使用，用完需自行关闭"""
+        return sqlite3.connect(f"file:{self.db_name}?mode=ro", uri=True, timeout=BUSY_TIMEOUT)
+
+    def history_page(self, where, params, before_id=None, limit=500, conn=None):
+        """按 id 倒序取一页记录 (键集分页：从 before_id 之前继续取，不用 OFFSET)"""
+        sql = f"SELECT {self.HISTORY_COLUMNS} FROM record_view WHERE {where}"
+        args = list(params)
+        if before_id is not None:
+            sql += " AND id < ?"
+            args.append(before_id)
+        sql += " ORDER BY id DESC LIMIT ?"
+        args.append(limit)
+        return (conn or self.read_conn).execute(sql, args).fetchall()
+
+    # --- 箱号计数器：按 (产品, 规则, 年, 月, 批次) 复合键计数，确保每个产品单独计数 ---
+    @staticmethod
+    def _counter_key(product_id, rule_id, year, month, repair_level):
+        return (int(product_id or 0), int(rule_id or 0), int(year), int(month), int(repair_level or 0))
 
-    # --- 核心修改：计数器增加 product_id 参数 ---
     def get_box_counter(self, product_id, rule_id, year, month, repair_level=0):
-        # Key格式: P{prod_id}_R{rule_id}_{YYYY}_{MM}_{Repair}
-        # 确保每个产品单独计数
-        key = f"P{product_id}_R{rule_id}_{year}_{month}_{repair_level}"
-        self.cursor.execute("SELECT current_val FROM box_counters WHERE key=?", (key,))
+        self.cursor.execute("""SELECT current_val FROM box_counters
+                               WHERE product_id=? AND rule_id=? AND year=? AND month=? AND repair_level=?""",
+                            self._counter_key(product_id, rule_id, year, month, repair_level))
         res = self.cursor.fetchone()
         return res[0] if res else repair_level * 10000 # 初始值
 
     def increment_box_counter(self, product_id, rule_id, year, month, repair_level=0):
-        key = f"P{product_id}_R{rule_id}_{year}_{month}_{repair_level}"
-        current = self.get_box_counter(product_id, rule_id, year, month, repair_level)
-        new_val = current + 1
-        self.cursor.execute("INSERT OR REPLACE INTO box_counters (key, current_val) VALUES (?, ?)", (key, new_val))
-        self.conn.commit()
-        return new_val
+        return self.reserve_box_block(product_id, rule_id, year, month, repair_level, 1)[1]
+
+    def reserve_box_block(self, product_id, rule_id, year, month, repair_level, count):
+        """原子预留 count 个连续流水号 (单条 UPSERT，立即事务)，返回 (首个, 最后一个)"""
+        key = self._counter_key(product_id, rule_id, year, month, repair_level)
+        upsert = """INSERT INTO box_counters (product_id, rule_id, year, month, repair_level, current_val)
+                    VALUES (?,?,?,?,?,?)
+                    ON CONFLICT (product_id, rule_id, year, month, repair_level)
+                    DO UPDATE SET current_val = current_val + ?"""
+        params = key + (key[4] * 10000 + count, count)
+        with self.immediate() as c:
+            if HAS_RETURNING:
+                c.execute(upsert + " RETURNING current_val", params)
+                last = c.fetchall()[0][0]
+            else:
+                # 旧版 SQLite：UPSERT 后在同一写锁内读取，仍然是原子的
+                c.execute(upsert, params)
+                c.execute("""SELECT current_val FROM box_counters
+                             WHERE product_id=? AND rule_id=? AND year=? AND month=? AND repair_level=?""", key)
+                last = c.fetchone()[0]
+        return last - count + 1, last
+
+    def release_box_block(self, product_id, rule_id, year, month, repair_level, reserved_last, keep_last):
+        """归还未用完的号段：仅当计数器仍停在本工位预留的末尾时回退到 keep_last"""
+        key = self._counter_key(product_id, rule_id, year, month, repair_level)
+        with self.immediate() as c:
+            c.execute("""UPDATE box_counters SET current_val=?
+                         WHERE product_id=? AND rule_id=? AND year=? AND month=? AND repair_level=? AND current_val=?""",
+                      (keep_last,) + key + (reserved_last,))
+            return c.rowcount > 0
+
+    @contextmanager
+    def immediate(self):
+        """BEGIN IMMEDIATE 事务：开始即取得写锁，多个程序实例共享数据库时也不会交错"""
+        if self.conn.in_transaction: self.conn.commit()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn.cursor()
+            self.conn.commit()
+        except:
+            self.conn.rollback()
+            raise
 
     def close(self):
-        self.conn.close()
+        """关闭读写连接 (程序退出时调用)"""
+        for c in (self.read_conn, self.conn):
+            if c is None: continue
+            try: c.close()
+            except sqlite3.Error: pass
+        self.read_conn = None
+        self.conn = None
@@ -0,0 +1,85 @@
+import csv
+import os
+
+# 导出列 (不含 ID)，与历史页表格一致
+EXPORT_HEADERS = ["箱号", "序号", "名称", "规格", "型号", "颜色", "SN", "69码", "时间"]
+EXPORT_COLUMNS = "box_no, box_sn_seq, name, spec, model, color, sn, code69, print_day"
+CHUNK_SIZE = 5000
+# Excel 单个工作表最多 1048576 行 (含表头)
+XLSX_MAX_ROWS = 1048576
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def _format_row(row):
+    # 时间列为 print_day (yyyyMMdd)，与界面显示一致
+    return ["" if v is None else v for v in row]
+
+
+def iter_chunks(conn, where, params, chunk_size=CHUNK_SIZE):
+    """按过滤条件从游标分块读取 (id 倒序)，不一次性载入全部结果"""
+    cur = conn.execute(f"SELECT {EXPORT_COLUMNS} FROM record_view WHERE {where} ORDER BY id DESC", params)
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows: break
+        yield [_format_row(r) for r in rows]
+
+
+def _write_csv(path, chunks, step):
+    # utf-8-sig 让 Excel 直接打开不乱码
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.writer(f)
+        w.writerow(EXPORT_HEADERS)
+        for rows in chunks:
+            w.writerows(rows)
+            step(len(rows))
+
+
+def _write_xlsx(path, chunks, step):
+    import xlsxwriter
+    # constant_memory: 逐行写出到临时文件，内存占用与行数无关 (要求按行顺序写入)
+    wb = xlsxwriter.Workbook(path, {"constant_memory": True})
+    try:
+        ws, r, sheet_no = None, XLSX_MAX_ROWS, 0
+        for rows in chunks:
+            for row in rows:
+                if r >= XLSX_MAX_ROWS:
+                    # 超过单表上限时续写到新工作表
+                    sheet_no += 1
+                    ws = wb.add_worksheet(f"打印记录{sheet_no}" if sheet_no > 1 else "打印记录")
+                    ws.write_row(0, 0, EXPORT_HEADERS)
+                    r = 1
+                ws.write_row(r, 0, row)
+                r += 1
+            step(len(rows))
+        if ws is None:
+            wb.add_worksheet("打印记录").write_row(0, 0, EXPORT_HEADERS)
+    finally:
+        wb.close()
+
+
+def export_history(conn, where, params, path, progress=None, is_cancelled=None):
+    """
+    将过滤条件下的打印记录流式导出到 path (.csv 为 CSV，其余为 xlsx)。
+    progress(done, total) 每块回调一次；is_cancelled() 为真时中止并删除未完成的文件。
+    返回导出行数。
+    """
+    total = conn.execute(f"SELECT COUNT(*) FROM record_view WHERE {where}", params).fetchone()[0]
+    done = [0]
+
+    def step(n):
+        done[0] += n
+        if progress: progress(done[0], total)
+        if is_cancelled and is_cancelled(): raise ExportCancelled()
+
+    chunks = iter_chunks(conn, where, params)
+    try:
+        if path.lower().endswith(".csv"): _write_csv(path, chunks, step)
+        else: _write_xlsx(path, chunks, step)
+    except ExportCancelled:
+        try: os.remove(path)
+        except OSError: pass
+        raise
+    return done[0]
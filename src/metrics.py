@@ -0,0 +1,150 @@
+"""
+装箱流水线各阶段耗时统计。
+每个阶段一个对数分桶直方图 (桶宽约 9%)，记录一次只是一次桶计数，适合放在扫码 / 打印热路径上；
+按固定间隔轮转为一个时间片，内存中保留最近一小时的时间片，轮转出的时间片由 Database.flush_metrics 写入 metrics 表。
+"""
+import collections
+import math
+import threading
+import time
+
+# (阶段, 显示名称)，顺序即诊断页显示顺序
+STAGES = [
+    ("validate", "SN规则校验"),
+    ("dup_check", "SN查重"),
+    ("take_seq", "取流水号"),
+    ("payload", "组装打印数据"),
+    ("print", "打印机出标"),
+    ("db_commit", "写入记录"),
+    ("box_total", "整箱 (提交→写库)"),
+]
+
+# 运行时间不足该值时按该值折算每小时箱数，避免刚启动时数值虚高
+MIN_RATE_SECONDS = 600
+
+BUCKET_BASE_MS = 0.01            # 第 0 桶上界
+BUCKET_GROWTH = 2 ** (1 / 8)     # 相邻桶上界之比
+NUM_BUCKETS = 256                # 最后一桶上界约 4.3 小时
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+
+def bucket_of(ms):
+    if ms <= BUCKET_BASE_MS: return 0
+    return min(int(math.ceil(math.log(ms / BUCKET_BASE_MS) / _LOG_GROWTH - 1e-9)), NUM_BUCKETS - 1)
+
+
+def bucket_upper(i):
+    return BUCKET_BASE_MS * BUCKET_GROWTH ** i
+
+
+class Histogram:
+    """毫秒耗时直方图 (稀疏桶)，可合并"""
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self, count=0, total=0.0, max_ms=0.0, buckets=None):
+        self.count, self.total, self.max = count, total, max_ms
+        self.buckets = buckets if buckets is not None else {}
+
+    def add(self, ms):
+        self.count += 1
+        self.total += ms
+        if ms > self.max: self.max = ms
+        b = bucket_of(ms)
+        self.buckets[b] = self.buckets.get(b, 0) + 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        if other.max > self.max: self.max = other.max
+        for b, n in other.buckets.items():
+            self.buckets[b] = self.buckets.get(b, 0) + n
+        return self
+
+    def percentile(self, q):
+        """近似分位数 (取所在桶上界，不超过最大值)；无数据返回 None"""
+        if not self.count: return None
+        need = q * self.count
+        seen = 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if seen >= need: return min(bucket_upper(b), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "t0")
+
+    def __init__(self, metrics, stage):
+        self.metrics, self.stage = metrics, stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.stage, time.perf_counter() - self.t0)
+        return False
+
+
+class PipelineMetrics:
+    """
+    各阶段滚动耗时统计。
+    record / timer 记录到当前时间片；rotate() 把当前时间片移入滚动窗口并返回，供写库。
+    """
+    def __init__(self, window_seconds=3600):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._current = {}                    # 阶段 -> Histogram (上次轮转以来)
+        self._window = collections.deque()    # (轮转时刻, {阶段: Histogram})
+        self._boxes = collections.deque()     # 最近一小时每箱完成时刻
+        self.started = time.time()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            h = self._current.get(stage)
+            if h is None: h = self._current[stage] = Histogram()
+            h.add(seconds * 1000.0)
+
+    def timer(self, stage):
+        """with metrics.timer('dup_check'): ... 记录代码块耗时"""
+        return _Timer(self, stage)
+
+    def box_done(self):
+        now = time.time()
+        with self._lock:
+            self._boxes.append(now)
+            self._trim(now)
+
+    def _trim(self, now):
+        while self._boxes and self._boxes[0] < now - 3600: self._boxes.popleft()
+        while self._window and self._window[0][0] < now - self.window_seconds: self._window.popleft()
+
+    def rotate(self):
+        """结束当前时间片：移入滚动窗口，返回 (时刻, {阶段: Histogram})；无数据时返回 None"""
+        now = time.time()
+        with self._lock:
+            cur, self._current = self._current, {}
+            if cur: self._window.append((now, cur))
+            self._trim(now)
+        return (int(now), cur) if cur else None
+
+    def snapshot(self):
+        """滚动窗口 (最近一小时) 内各阶段合并后的直方图"""
+        with self._lock:
+            self._trim(time.time())
+            parts = [h for _, hs in self._window for h in hs.items()] + list(self._current.items())
+        out = {}
+        for stage, h in parts:
+            out.setdefault(stage, Histogram()).merge(h)
+        return out
+
+    def boxes_per_hour(self):
+        """最近一小时完成的箱数 (运行不足一小时按已运行时间折算，至少按 10 分钟计)"""
+        now = time.time()
+        with self._lock:
+            self._trim(now)
+            n = len(self._boxes)
+        return n * 3600 / min(max(now - self.started, MIN_RATE_SECONDS), 3600)
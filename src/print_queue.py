@@ -0,0 +1,92 @@
+import itertools
+import queue
+import time
+from PyQt5.QtCore import QThread, pyqtSignal
+from src import profiler
+
+_job_ids = itertools.count(1)
+
+class PrintJob:
+    """一次打印任务 (一整箱)。context 由提交方填写，打印成功后据此写入记录"""
+    def __init__(self, template_path, data_map, printer_name=None, context=None):
+        self.id = next(_job_ids)
+        self.template_path = template_path
+        self.data_map = data_map
+        self.printer_name = printer_name
+        self.context = context or {}
+        self.ok = False
+        self.msg = ""
+        self.elapsed = 0.0  # 打印耗时 (秒)
+
+
+class PrintWorker(QThread):
+    """
+    后台打印线程。
+    打印机对象 (COM) 由 printer_factory 在本线程内创建并独占，线程以 STA 模式初始化 COM；
+    任务按提交顺序逐个打印，结果通过信号回到界面线程。
+    """
+    job_started = pyqtSignal(object)
+    job_finished = pyqtSignal(object)
+    ready = pyqtSignal(bool, str) # 打印引擎启动完成 (是否可用, 说明)
+
+    def __init__(self, printer_factory, parent=None, warmup_path=None):
+        super().__init__(parent)
+        self._factory = printer_factory
+        self._queue = queue.Queue()
+        # 启动后预先打开的模板 (上次打印使用的模板)
+        self._warmup_path = warmup_path
+        # 引擎状态: None 启动中 / True 就绪 / False 不可用；启动前提交的任务在队列中等待
+        self.engine_ok = None
+        self.engine_msg = "启动中..."
+
+    def submit(self, job):
+        self._queue.put(job)
+        return job
+
+    def pending_count(self):
+        return self._queue.qsize()
+
+    def stop(self, timeout_ms=30000):
+        """打印完已提交的任务后退出线程"""
+        if not self.isRunning(): return
+        self._queue.put(None)
+        self.wait(timeout_ms)
+
+    def run(self):
+        try:
+            import pythoncom
+            pythoncom.CoInitialize() # 单线程单元 (STA)
+        except ImportError:
+            pythoncom = None
+
+        printer, init_error = None, ""
+        try:
+            with profiler.span("打印机初始化"):
+                printer = self._factory()
+        except Exception as e:
+            init_error = f"打印机初始化失败: {e}"
+            print(f"Print Worker Error: {e}")
+        if printer and self._warmup_path:
+            with profiler.span("预热模板"):
+                printer.warm_up(self._warmup_path)
+        self.engine_ok = bool(printer and printer.is_ready())
+        self.engine_msg = "就绪" if self.engine_ok else (init_error or "打印引擎未就绪，打印时将重试启动")
+        self.ready.emit(self.engine_ok, self.engine_msg)
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None: break
+                self.job_started.emit(job)
+                t0 = time.perf_counter()
+                try:
+                    if printer is None: job.ok, job.msg = False, init_error
+                    else: job.ok, job.msg = printer.print_label(job.template_path, job.data_map, job.printer_name)
+                except Exception as e:
+                    job.ok, job.msg = False, f"打印出错: {e}"
+                job.elapsed = time.perf_counter() - t0
+                self.job_finished.emit(job)
+        finally:
+            if printer:
+                try: printer.quit()
+                except: pass
+            if pythoncom: pythoncom.CoUninitialize()
@@ -0,0 +1,80 @@
+import json
+import os
+import threading
+import time
+import datetime
+
+# 可选打印后端 (设置项 printer_backend)
+PRINTER_BACKENDS = [
+    ("bartender", "BarTender (COM)"),
+    ("recording", "记录模式 (不实际打印)"),
+]
+DEFAULT_BACKEND = "bartender"
+# 默认缓存的已打开模板数量 (可通过设置项 format_cache_size 修改)
+DEFAULT_FORMAT_CACHE_SIZE = 4
+
+class PrinterBackend:
+    """打印后端接口：print_label 返回 (成功, 消息)，quit 释放资源"""
+    def print_label(self, template_path, data_map, printer_name=None):
+        raise NotImplementedError
+
+    def is_ready(self):
+        """引擎是否已可用 (用于界面显示)"""
+        return True
+
+    def warm_up(self, template_path):
+        """预先打开模板，使第一箱与后续打印一样快 (可选实现)"""
+        pass
+
+    def quit(self):
+        pass
+
+
+class RecordingPrinter(PrinterBackend):
+    """
+    记录模式：不调用打印机，只记录每个任务的模板路径与数据。
+    output_path 为空时保存在内存 (self.jobs)，否则按行追加 JSON；
+    latency_ms 模拟打印耗时，用于在无 Windows 环境下测量扫码→打印→写库吞吐。
+    """
+    def __init__(self, output_path=None, latency_ms=0):
+        self.output_path = output_path or None
+        self.latency_ms = max(0, int(latency_ms or 0))
+        self.jobs = []
+        self._lock = threading.Lock()
+
+    def print_label(self, template_path, data_map, printer_name=None):
+        if self.latency_ms: time.sleep(self.latency_ms / 1000.0)
+        rec = {
+            "time": datetime.datetime.now().isoformat(timespec="milliseconds"),
+            "template_path": template_path,
+            "printer": printer_name,
+            "data": {k: str(v) for k, v in data_map.items()},
+        }
+        try:
+            with self._lock:
+                if self.output_path:
+                    with open(self.output_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                else:
+                    self.jobs.append(rec)
+        except OSError as e:
+            return False, f"记录失败: {e}"
+        return True, "打印成功(记录模式)"
+
+
+def create_printer(backend=DEFAULT_BACKEND, cache_size=None, recording_path=None, latency_ms=0):
+    """按名称创建打印后端；BarTender 后端延迟导入，非 Windows 环境也可使用记录模式"""
+    if backend == "recording":
+        return RecordingPrinter(recording_path, latency_ms)
+    from src.bartender import BartenderPrinter
+    return BartenderPrinter(cache_size)
+
+
+def printer_factory_from_settings(db):
+    """在界面线程读取设置，返回可在打印线程内调用的无参工厂函数"""
+    backend = db.get_setting('printer_backend') or DEFAULT_BACKEND
+    cache_size = db.get_int_setting('format_cache_size', DEFAULT_FORMAT_CACHE_SIZE)
+    latency_ms = db.get_int_setting('recording_latency_ms', 0)
+    recording_path = db.get_setting('recording_path') or None
+    if recording_path: recording_path = os.path.abspath(recording_path)
+    return lambda: create_printer(backend, cache_size, recording_path, latency_ms)
@@ -0,0 +1,133 @@
+import csv
+import os
+import time
+# pandas 只在实际导入时加载 (启动时不导入)
+
+# 导入模式
+MODE_INSERT = "insert"    # 仅新增，SN前4 已存在的行拒绝
+MODE_UPSERT = "upsert"    # SN前4 已存在时按文件内容更新
+MODE_DRY_RUN = "dry_run"  # 只校验并生成报告，不写入
+
+PRODUCT_COLUMNS = ("name", "spec", "model", "color", "sn4", "sku", "code69",
+                   "qty", "weight", "template_path", "rule_id", "sn_rule_id")
+TEXT_COLUMNS = ("name", "spec", "model", "color", "sn4", "sku", "code69", "weight", "template_path")
+# 整数列及空值时的默认值
+INT_COLUMNS = {"qty": 1, "rule_id": 0, "sn_rule_id": 0}
+# 整数列允许的最大绝对值 (超出视为非法，避免转换 int64 时溢出)
+INT_LIMIT = 2 ** 31 - 1
+REQUIRED_COLUMNS = ("name", "sn4")
+
+
+def read_catalog(path):
+    """读取产品表 (xlsx/xls/csv)，所有列按文本读入，避免 69码等长数字变成浮点"""
+    import pandas as pd
+    if path.lower().endswith(".csv"):
+        return pd.read_csv(path, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    return pd.read_excel(path, dtype=str)
+
+
+def normalize(df):
+    """
+    整列校验与规范化。
+    返回 (合格行 DataFrame, 拒绝行列表 [(Excel行号, sn4, name, 原因)])；合格行保留原行号于 'row_no' 列。
+    """
+    import numpy as np
+    import pandas as pd
+    out = pd.DataFrame(index=df.index)
+    out["row_no"] = df.index + 2  # Excel 行号 (第 1 行为表头)
+    for col in TEXT_COLUMNS:
+        if col in df.columns: out[col] = df[col].fillna("").astype(str).str.strip()
+        else: out[col] = ""
+
+    reason = pd.Series("", index=df.index, dtype=object)
+
+    def reject(mask, text):
+        # 每行只记录第一个原因
+        reason[mask & (reason == "")] = text
+
+    for col, default in INT_COLUMNS.items():
+        if col in df.columns:
+            raw = df[col].fillna("").astype(str).str.strip()
+            num = pd.to_numeric(raw.where(raw != "", str(default)), errors="coerce")
+            # inf / 1e400 等可通过 to_numeric 但无法转为整数，与非整数同样按行拒绝
+            bad_num = num.isna() | ~np.isfinite(num) | (num != num.round())
+            reject(bad_num, f"{col} 不是整数")
+            reject(num.abs() > INT_LIMIT, f"{col} 超出范围")
+            out[col] = num.where(~bad_num & (num.abs() <= INT_LIMIT), default).round().astype("int64")
+        else:
+            out[col] = default
+    reject(out["qty"] <= 0, "箱规数量必须大于 0")
+    reject(out["name"] == "", "名称为空")
+    reject(out["sn4"] == "", "SN前4为空")
+    # 文件内重复在 import_products 中于全部校验之后判定 (只与合格行比较)
+
+    bad = reason != ""
+    rejects = list(zip(out.loc[bad, "row_no"], out.loc[bad, "sn4"], out.loc[bad, "name"], reason[bad]))
+    return out[~bad], rejects
+
+
+def write_report(path, rejects):
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.writer(f)
+        w.writerow(["行号", "SN前4", "名称", "原因"])
+        w.writerows(rejects)
+
+
+def import_products(db, df, mode=MODE_INSERT, report_path=None):
+    """
+    批量导入产品：整列校验 → 一次查询比对已有 SN前4 → 单个事务 executemany 写入。
+    有拒绝行且给出 report_path 时写出拒绝报告 (CSV)。返回结果 dict。
+    """
+    import pandas as pd
+    t0 = time.perf_counter()
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing: raise ValueError(f"缺少列: {', '.join(missing)}")
+
+    good, rejects = normalize(df)
+
+    # 一次查出已有 SN前4 及有效规则 ID
+    existing = {r[0] for r in db.read_conn.execute("SELECT sn4 FROM products")}
+    box_ids = {r[0] for r in db.read_conn.execute("SELECT id FROM box_rules")} | {0}
+    sn_ids = {r[0] for r in db.read_conn.execute("SELECT id FROM sn_rules")} | {0}
+
+    is_dup = good["sn4"].isin(existing)
+    bad_rule = ~good["rule_id"].isin(box_ids)
+    bad_sn_rule = ~good["sn_rule_id"].isin(sn_ids)
+    reason = pd.Series("", index=good.index, dtype=object)
+    reason[bad_sn_rule] = "SN规则不存在"
+    reason[bad_rule] = "箱号规则不存在"
+    if mode != MODE_UPSERT: reason[is_dup & (reason == "")] = "SN前4已存在"
+    # 文件内重复：只有通过校验的行才占用 SN前4，被拒绝的行不会让后面的合格行被判为重复
+    ok = reason == ""
+    file_dup = good.loc[ok, "sn4"].duplicated(keep="first")
+    reason[file_dup[file_dup].index] = "文件内 SN前4 重复"
+    bad = reason != ""
+    rejects += list(zip(good.loc[bad, "row_no"], good.loc[bad, "sn4"], good.loc[bad, "name"], reason[bad]))
+    rejects.sort(key=lambda r: r[0])
+    good, is_dup = good[~bad], is_dup[~bad]
+
+    result = {"mode": mode, "total": len(df), "inserted": int((~is_dup).sum()), "updated": int(is_dup.sum()),
+              "rejected": len(rejects), "report": None}
+
+    if mode != MODE_DRY_RUN and len(good):
+        rows = list(good[list(PRODUCT_COLUMNS)].itertuples(index=False, name=None))
+        cols = ", ".join(PRODUCT_COLUMNS)
+        sql = f"INSERT INTO products ({cols}) VALUES ({','.join('?' * len(PRODUCT_COLUMNS))})"
+        if mode == MODE_UPSERT:
+            # 只更新文件中出现的列，缺省列不覆盖已有数据
+            upd = [c for c in PRODUCT_COLUMNS if c != "sn4" and c in df.columns]
+            sql += " ON CONFLICT(sn4) DO " + (
+                "UPDATE SET " + ", ".join(f"{c}=excluded.{c}" for c in upd) if upd else "NOTHING")
+        with db.immediate() as cur:
+            cur.executemany(sql, rows)
+
+    if rejects and report_path:
+        write_report(report_path, rejects)
+        result["report"] = report_path
+    result["elapsed"] = round(time.perf_counter() - t0, 3)
+    return result
+
+
+def default_report_path(source_path):
+    base, _ = os.path.splitext(source_path)
+    return f"{base}_导入报告.csv"
@@ -0,0 +1,172 @@
+"""
+启动性能分析模式。
+通过环境变量 LABEL_PROFILE=1 (或 =trace 同时输出 Chrome trace) 或 main.py --profile / --profile-trace 开启；
+记录各启动阶段及模块导入的耗时区间，退出时写出报告到 logs/ 目录。未开启时 span() 为空操作。
+"""
+import atexit
+import builtins
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+ENV_VAR = "LABEL_PROFILE"
+LOG_DIR = "logs"
+# 报告中列出耗时最多的导入数
+TOP_IMPORTS = 30
+
+_enabled = False
+_trace = False
+_t0 = 0.0
+_spans = []   # (名称, 类别, 开始秒, 耗时秒, 线程 id, 深度)
+_marks = []   # (名称, 时刻秒)
+_local = threading.local()
+_lock = threading.Lock()
+_orig_import = None
+
+
+class _NullSpan:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+
+_NULL = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "cat", "start", "depth")
+
+    def __init__(self, name, cat):
+        self.name, self.cat = name, cat
+
+    def __enter__(self):
+        self.depth = getattr(_local, "depth", 0)
+        _local.depth = self.depth + 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        _local.depth = self.depth
+        with _lock:
+            _spans.append((self.name, self.cat, self.start - _t0, end - self.start, threading.get_ident(), self.depth))
+        return False
+
+
+def enabled():
+    return _enabled
+
+
+def span(name, cat="startup"):
+    """记录一个耗时区间 (with 语句)；未开启分析时返回空操作"""
+    return _Span(name, cat) if _enabled else _NULL
+
+
+def mark(name):
+    """记录一个时间点 (如窗口显示)"""
+    if _enabled: _marks.append((name, time.perf_counter() - _t0))
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # 只记录首次导入 (模块尚未载入)；已载入的 import 语句直接走原函数
+    key = name
+    if level and globals: key = f"{globals.get('__package__') or ''}.{name}".strip(".")
+    if key in sys.modules or not key:
+        return _orig_import(name, globals, locals, fromlist, level)
+    with _Span(key, "import"):
+        return _orig_import(name, globals, locals, fromlist, level)
+
+
+def enable(trace=False):
+    """开启分析 (应在导入 PyQt 和程序模块之前调用)，退出时自动写出报告"""
+    global _enabled, _trace, _t0, _orig_import
+    if _enabled: return
+    _enabled, _trace = True, trace
+    _t0 = time.perf_counter()
+    _orig_import = builtins.__import__
+    builtins.__import__ = _timed_import
+    atexit.register(dump)
+
+
+def enable_from_env(argv=None):
+    """按命令行参数 / 环境变量决定是否开启，返回是否已开启"""
+    argv = sys.argv if argv is None else argv
+    env = os.environ.get(ENV_VAR, "").strip().lower()
+    trace = "--profile-trace" in argv or env == "trace"
+    if trace or "--profile" in argv or env not in ("", "0", "false", "no"):
+        enable(trace)
+    return _enabled
+
+
+def _self_times(spans):
+    """
+    按线程还原嵌套关系，返回 [名称, 类别, 开始, 耗时, 线程, 深度, 自身耗时, 父区间类别] 列表；
+    自身耗时 = 耗时 - 直接子区间耗时。
+    """
+    out = []
+    stack = []  # (线程 id, 深度, 下标)
+    for name, cat, start, dur, tid, depth in sorted(spans, key=lambda s: (s[4], s[2], s[5])):
+        while stack and (stack[-1][0] != tid or stack[-1][1] >= depth):
+            stack.pop()
+        parent = out[stack[-1][2]] if stack else None
+        if parent: parent[6] -= dur
+        out.append([name, cat, start, dur, tid, depth, dur, parent[1] if parent else None])
+        stack.append((tid, depth, len(out) - 1))
+    return out
+
+
+def _write_report(path, spans, marks):
+    rows = _self_times(spans)
+    main_tid = threading.main_thread().ident
+    lines = [f"启动性能分析报告 {datetime.datetime.now():%Y-%m-%d %H:%M:%S}", ""]
+    lines.append("== 时间点 (自开启分析起, 毫秒) ==")
+    for name, at in marks:
+        lines.append(f"{at * 1000:10.1f}  {name}")
+    lines.append("")
+    lines.append("== 启动阶段 (开始 / 耗时 / 自身耗时, 毫秒) ==")
+    for name, cat, start, dur, tid, depth, self_t, _ in sorted(rows, key=lambda r: (r[4] != main_tid, r[4], r[2])):
+        if cat == "import": continue
+        thread = "" if tid == main_tid else f"  [线程 {tid}]"
+        lines.append(f"{start * 1000:10.1f} {dur * 1000:10.1f} {self_t * 1000:10.1f}  {'  ' * depth}{name}{thread}")
+    imports = [r for r in rows if r[1] == "import"]
+    lines.append("")
+    lines.append(f"== 模块导入 (共 {len(imports)} 个, 按累计耗时前 {TOP_IMPORTS}, 毫秒: 累计 / 自身) ==")
+    for name, cat, start, dur, tid, depth, self_t, _ in sorted(imports, key=lambda r: -r[3])[:TOP_IMPORTS]:
+        lines.append(f"{dur * 1000:10.1f} {self_t * 1000:10.1f}  {name}")
+    top_level = sum(r[3] for r in imports if r[7] != "import")
+    lines.append(f"导入总耗时 (不重复计算嵌套): {top_level * 1000:.1f} ms")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _write_trace(path, spans, marks):
+    # Chrome trace 格式 (chrome://tracing / Perfetto 可直接打开)，时间单位微秒
+    pid = os.getpid()
+    events = [{"name": name, "cat": cat, "ph": "X", "ts": round(start * 1e6, 1), "dur": round(dur * 1e6, 1),
+               "pid": pid, "tid": tid} for name, cat, start, dur, tid, depth in spans]
+    events += [{"name": name, "ph": "i", "s": "g", "ts": round(at * 1e6, 1), "pid": pid, "tid": 0}
+               for name, at in marks]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+def dump(log_dir=LOG_DIR):
+    """写出报告 (及 Chrome trace)，返回写出的文件路径列表"""
+    if not _enabled: return []
+    with _lock:
+        spans, marks = list(_spans), list(_marks)
+    paths = []
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+        base = os.path.join(log_dir, f"profile_{datetime.datetime.now():%Y%m%d_%H%M%S}")
+        _write_report(base + ".txt", spans, marks)
+        paths.append(base + ".txt")
+        if _trace:
+            _write_trace(base + ".trace.json", spans, marks)
+            paths.append(base + ".trace.json")
+        print(f"性能分析报告已写入: {', '.join(paths)}")
+    except Exception as e:
+        print(f"Profiler Dump Error: {e}")
+    return paths
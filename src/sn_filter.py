@@ -0,0 +1,82 @@
+import math
+
+
+class SnBloomFilter:
+    """
+    已打印 SN 的布隆过滤器。
+    判定"不存在"一定准确 (扫码时可直接跳过数据库)；判定"可能存在"时再查 SQLite 确认。
+    过滤器只存在于内存中，因此直接使用 Python 内置 hash (进程内稳定，速度快)。
+    """
+    MIN_CAPACITY = 100000
+
+    def __init__(self, capacity=MIN_CAPACITY, error_rate=0.001):
+        self.capacity = max(int(capacity), self.MIN_CAPACITY)
+        self.error_rate = error_rate
+        # 最优位数 m = -n*ln(p)/ln2^2，哈希次数 k = m/n*ln2
+        self.num_bits = int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / self.capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0   # 已加入的 SN 数
+        self.stale = 0   # 已删除但仍残留在过滤器中的 SN 数 (布隆过滤器无法删除)
+        # 已载入的最大 records.id 及当时写连接的 PRAGMA data_version (用于补入其他工位新打印的 SN)
+        self.last_id = 0
+        self.data_version = None
+        self.synced_at = 0.0   # 上次检查 data_version 的 time.monotonic()
+        # 命中统计
+        self.lookups = 0
+        self.negatives = 0        # 过滤器判定不存在，未查数据库
+        self.true_positives = 0   # 查库确认已打印
+        self.false_positives = 0  # 查库发现未打印 (误判)
+
+    def _positions(self, sn):
+        # 双重哈希：由一个 64 位哈希派生 k 个位置
+        h = hash(sn) & 0xFFFFFFFFFFFFFFFF
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        m = self.num_bits
+        return [(h1 + i * h2) % m for i in range(self.num_hashes)]
+
+    def add(self, sn):
+        bits = self.bits
+        for p in self._positions(sn):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def discard(self, sn):
+        """记录一次删除；位无法清除，只累计残留数以便决定何时重建"""
+        self.stale += 1
+
+    def might_contain(self, sn):
+        self.lookups += 1
+        bits = self.bits
+        for p in self._positions(sn):
+            if not bits[p >> 3] & (1 << (p & 7)):
+                self.negatives += 1
+                return False
+        return True
+
+    def record_db_result(self, exists):
+        """可能命中后，记录数据库的确认结果"""
+        if exists: self.true_positives += 1
+        else: self.false_positives += 1
+
+    def needs_rebuild(self):
+        """超出容量 (误判率上升) 或残留过多时需要重建"""
+        return self.count > self.capacity or self.stale > max(self.count // 5, 1000)
+
+    def stats(self):
+        absent = self.negatives + self.false_positives  # 实际未打印的查询次数
+        return {
+            "count": self.count,
+            "stale": self.stale,
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "hashes": self.num_hashes,
+            "memory_bytes": len(self.bits),
+            "bytes_per_million_sn": int(len(self.bits) / self.capacity * 1000000),
+            "lookups": self.lookups,
+            "negatives": self.negatives,
+            "true_positives": self.true_positives,
+            "false_positives": self.false_positives,
+            "false_positive_rate": round(self.false_positives / absent, 6) if absent else 0.0,
+            "db_skip_rate": round(self.negatives / self.lookups, 6) if self.lookups else 0.0,
+        }
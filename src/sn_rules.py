@@ -0,0 +1,91 @@
+import re
+from src.database import Database
+
+# SN 尾部的不可见字符 (扫码枪回车、零宽空格、BOM 等)
+_TRAILING_JUNK = re.compile(r'[\s\W\u200b\ufeff]+$')
+# 规则占位符
+_RULE_TOKENS = re.compile(r'(\{SN4\}|\{BATCH\}|\{SEQ\d+\})')
+_SEQ_TOKEN = re.compile(r'\{SEQ(\d+)\}')
+
+
+class CompiledSnRule:
+    """预编译的 SN 校验规则 (对应某个产品前缀与批次)"""
+    __slots__ = ('prefix', 'length', 'pattern', 'error')
+
+    def __init__(self, prefix, length=0, pattern=None, error=None):
+        self.prefix = prefix
+        self.length = length
+        self.pattern = pattern
+        self.error = error
+
+
+class SnRuleEngine:
+    """
+    SN 校验规则引擎。
+    编译结果按 (sn_rule_id, sn4, 批次) 缓存，扫码时只做一次预编译正则匹配；
+    设置页修改 / 删除规则时通过 Database.notify('sn_rules') 使缓存失效。
+    """
+    def __init__(self, db: Database):
+        self.db = db
+        self._rules = {}     # sn_rule_id -> (name, rule_string, length) 或 None
+        self._compiled = {}  # (sn_rule_id, sn4, batch) -> CompiledSnRule
+        db.subscribe('sn_rules', self.invalidate)
+
+    def get_rule(self, rule_id):
+        """读取规则定义 (name, rule_string, length)，不存在返回 None"""
+        if not rule_id: return None
+        if rule_id not in self._rules:
+            c = self.db.read_conn.cursor()
+            c.execute("SELECT name, rule_string, length FROM sn_rules WHERE id=?", (rule_id,))
+            self._rules[rule_id] = c.fetchone()
+        return self._rules[rule_id]
+
+    def get(self, rule_id, sn4, batch):
+        """取 (或编译) 指定产品前缀与批次的规则"""
+        key = (rule_id or 0, sn4, batch)
+        rule = self._compiled.get(key)
+        if rule is None:
+            rule = self._compiled[key] = self.compile(self.get_rule(rule_id), sn4, batch)
+        return rule
+
+    @staticmethod
+    def compile(rule_def, sn4, batch):
+        prefix = str(sn4 or '').strip()
+        if not rule_def: return CompiledSnRule(prefix)
+        fmt, length = rule_def[1], rule_def[2] or 0
+        regex_parts = []
+        for part in _RULE_TOKENS.split(fmt or ''):
+            if part == "{SN4}": regex_parts.append(re.escape(prefix))
+            elif part == "{BATCH}": regex_parts.append(re.escape(str(batch)))
+            elif part.startswith("{SEQ") and part.endswith("}"):
+                m = _SEQ_TOKEN.fullmatch(part)
+                if not m: return CompiledSnRule(prefix, length, error="规则错误")
+                regex_parts.append(f"\\d{{{int(m.group(1))}}}")
+            elif part:
+                regex_parts.append(re.escape(part))
+        try:
+            pattern = re.compile("^" + "".join(regex_parts) + "$")
+        except re.error:
+            return CompiledSnRule(prefix, length, error="正则错误")
+        return CompiledSnRule(prefix, length, pattern)
+
+    @staticmethod
+    def validate(rule, sn):
+        """返回 (是否通过, 错误提示)"""
+        sn = _TRAILING_JUNK.sub('', sn).strip()
+        if not sn.startswith(rule.prefix): return False, f"前缀不符！\n要求: {rule.prefix}"
+        if rule.length > 0 and len(sn) != rule.length: return False, f"长度错误！\n要求: {rule.length}位"
+        if rule.error: return False, rule.error
+        if rule.pattern is not None and not rule.pattern.match(sn): return False, f"格式不符！\nSN: {sn}"
+        return True, ""
+
+    def invalidate(self, rule_id=None):
+        """清除缓存；rule_id 为空时全部清除"""
+        if rule_id is None:
+            self._rules.clear(); self._compiled.clear()
+            return
+        try: rule_id = int(rule_id)
+        except (TypeError, ValueError): pass
+        self._rules.pop(rule_id, None)
+        for key in [k for k in self._compiled if k[0] == rule_id]:
+            del self._compiled[key]
@@ -1,19 +1,55 @@
-from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QTableWidget, QPushButton, QHBoxLayout, 
-                             QTableWidgetItem, QLineEdit, QHeaderView, QAbstractItemView, 
-                             QMessageBox, QDateEdit, QCheckBox, QFileDialog, QLabel)
-from PyQt5.QtCore import Qt, QDate
-from src.database import Database
-from src.bartender import BartenderPrinter # 引入打印机
-import pandas as pd
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QTableView, QPushButton, QHBoxLayout, 
+                             QLineEdit, QHeaderView, QAbstractItemView, 
+                             QMessageBox, QDateEdit, QCheckBox, QFileDialog, QLabel, QProgressDialog)
+from PyQt5.QtCore import Qt, QDate, QThread, pyqtSignal
+from src.print_queue import PrintJob
+from src.ui.models import HistoryTableModel
+from src.history_export import export_history, ExportCancelled
 import datetime
 import os
+import time
+import traceback
+
+class ExportWorker(QThread):
+    """后台导出线程：使用独立只读连接，分块从游标写入文件"""
+    progress = pyqtSignal(int, int)
+    done = pyqtSignal(int)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, db, where, params, path, parent=None):
+        super().__init__(parent)
+        self.db, self.where, self.params, self.path = db, where, params, path
+        self._cancel = False
+
+    def cancel(self):
+        self._cancel = True
+
+    def run(self):
+        conn = None
+        try:
+            conn = self.db.open_reader()
+            n = export_history(conn, self.where, self.params, self.path,
+                               progress=self.progress.emit, is_cancelled=lambda: self._cancel)
+            self.done.emit(n)
+        except ExportCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        finally:
+            if conn: conn.close()
+
 
 class HistoryPage(QWidget):
-    def __init__(self):
+    def __init__(self, db, print_worker):
         super().__init__()
         try:
-            self.db = Database()
-            self.printer = BartenderPrinter() # 实例化打印机
+            self.db = db
+            # 补打与打印页共用后台打印线程
+            self.print_worker = print_worker
+            self.reprint_jobs = set()
+            self.export_worker = None
+            self.print_worker.job_finished.connect(self.on_reprint_finished)
             self.init_ui()
             self.load()
         except Exception as e:
@@ -74,16 +110,14 @@ class HistoryPage(QWidget):
         layout.addLayout(h_layout)
         
         # --- 表格区域 ---
-        self.table = QTableWidget()
-        # 修改：新增 "序号" 列 (Box SN Seq)
-        cols = ["ID", "箱号", "序号", "名称", "规格", "型号", "颜色", "SN", "69码", "时间"]
-        self.table.setColumnCount(len(cols))
-        self.table.setHorizontalHeaderLabels(cols)
+        # 表格只按需加载可见页，滚动到底部时继续向前翻页
+        self.model = HistoryTableModel(self.db, self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.verticalHeader().setDefaultSectionSize(24)
         
         header = self.table.horizontalHeader()
         header.setSectionResizeMode(0, QHeaderView.Stretch) 
-        header.setSectionResizeMode(1, QHeaderView.ResizeToContents) 
-        header.setSectionResizeMode(7, QHeaderView.ResizeToContents) 
         
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
@@ -95,178 +129,181 @@ class HistoryPage(QWidget):
 
     def load(self):
         try:
-            keyword = f"%{self.search_input.text().strip()}%"
-            self.table.setRowCount(0)
-            
-            cursor = self.db.conn.cursor()
-            
-            # 修改查询：增加 box_sn_seq
-            sql = """
-                SELECT id, box_no, box_sn_seq, name, spec, model, color, sn, code69, print_date 
-                FROM records 
-                WHERE (sn LIKE ? OR box_no LIKE ?)
-            """
-            params = [keyword, keyword]
-            
+            s_date = e_date = None
             if self.chk_date.isChecked():
                 s_date = self.date_start.date().toString("yyyy-MM-dd")
                 e_date = self.date_end.date().toString("yyyy-MM-dd")
-                start_time = f"{s_date} 00:00:00"
-                end_time = f"{e_date} 23:59:59"
-                sql += " AND print_date >= ? AND print_date <= ?"
-                params.append(start_time)
-                params.append(end_time)
-            
-            sql += " ORDER BY id DESC LIMIT 1000"
-            
-            cursor.execute(sql, params)
-            rows = cursor.fetchall()
-            
-            for r_idx, row in enumerate(rows):
-                self.table.insertRow(r_idx)
-                for c_idx, val in enumerate(row):
-                    text = str(val) if val is not None else ""
-                    # 时间列是最后一列 (索引9)
-                    if c_idx == 9 and len(text) >= 10:
-                        try: text = text[:10].replace("-", "")
-                        except: pass
-                    self.table.setItem(r_idx, c_idx, QTableWidgetItem(text))
-                    
+            where, params = self.db.history_filter(self.search_input.text().strip(), s_date, e_date)
+            self.model.set_filter(where, params)
+            # 列宽按首页内容计算一次，避免逐行测量
             self.table.resizeColumnToContents(1)
+            self.table.resizeColumnToContents(7)
             
         except Exception as e:
             print(f"Load History Error: {e}")
 
     def reprint_box(self):
         """重打选中记录所属的整箱标签"""
-        row = self.table.currentRow()
-        if row < 0:
+        row = self.table.currentIndex().row()
+        rec = self.model.row_values(row) if row >= 0 else None
+        if not rec:
             return QMessageBox.warning(self, "提示", "请先选择一条打印记录")
         
-        # 获取选中行的箱号和产品名称
-        box_no = self.table.item(row, 1).text()
-        prod_name = self.table.item(row, 3).text()
+        # 获取选中行所属的箱 (box_id 为隐藏列)
+        box_no, box_id = rec[1], rec[10]
         
         if QMessageBox.question(self, "确认", f"确定要重新打印箱号 [{box_no}] 吗？", 
                                 QMessageBox.Yes|QMessageBox.No) != QMessageBox.Yes:
             return
 
         try:
-            c = self.db.conn.cursor()
-            
-            # 1. 查找产品信息以获取模板路径和箱规
+            # 优先使用打印时保存的原始数据 (主键读取)，与首次打印完全一致
+            payload = self.db.get_box_payload(box_id)
+            full_path, final_dat = payload if payload else self.rebuild_payload(box_id)
+            job = PrintJob(full_path, final_dat, self.db.get_setting('default_printer'), context={'box_no': box_no})
+            self.reprint_jobs.add(job.id)
+            self.print_worker.submit(job)
+
+        except ValueError as e:
+            QMessageBox.warning(self, "错误", str(e))
+        except Exception as e:
+            traceback.print_exc()
+            QMessageBox.critical(self, "系统错误", str(e))
+
+    def rebuild_payload(self, box_id):
+        """未保存打印数据的旧箱：按箱信息与当前产品、字段映射重新组装，返回 (模板路径, 数据)"""
+        c = self.db.read_conn.cursor()
+        
+        # 1. 箱信息 (打印时的产品快照)
+        c.execute("SELECT box_no, product_id, name, spec, model, color, code69, print_ts FROM boxes WHERE id=?", (box_id,))
+        box = c.fetchone()
+        if not box:
+            raise ValueError("未找到该箱号的记录")
+        box_no, product_id, prod_name, spec, model, color, code69, print_ts = box
+
+        # 2. 查找产品信息以获取模板路径和箱规 (旧数据无产品ID时按名称查找)
+        c.execute("SELECT template_path, qty, weight, sku FROM products WHERE id=?", (product_id,))
+        prod_info = c.fetchone()
+        if not prod_info:
             c.execute("SELECT template_path, qty, weight, sku FROM products WHERE name=?", (prod_name,))
             prod_info = c.fetchone()
-            if not prod_info:
-                return QMessageBox.critical(self, "错误", f"找不到产品 [{prod_name}] 的信息，无法获取模板。")
-            
-            tmpl_path, qty, weight, sku = prod_info
-            
-            # 2. 查找该箱号下的所有记录
-            c.execute("SELECT sn, box_sn_seq, spec, model, color, code69, print_date FROM records WHERE box_no=? ORDER BY box_sn_seq", (box_no,))
-            records = c.fetchall()
-            
-            if not records:
-                return QMessageBox.warning(self, "错误", "未找到该箱号的记录")
+        if not prod_info:
+            raise ValueError(f"找不到产品 [{prod_name}] 的信息，无法获取模板。")
+        
+        tmpl_path, qty, weight, sku = prod_info
+        
+        # 3. 该箱的所有 SN
+        c.execute("SELECT sn, seq FROM records WHERE box_id=? ORDER BY seq", (box_id,))
+        records = c.fetchall()
+        
+        if not records:
+            raise ValueError("未找到该箱号的记录")
 
-            # 3. 构建打印数据
-            # 取第一条记录的信息作为公共信息
-            first_rec = records[0]
-            # records struct: 0:sn, 1:seq, 2:spec, 3:model, 4:color, 5:code69, 6:date
-            
-            data_map = {
-                "name": prod_name,
-                "spec": first_rec[2],
-                "model": first_rec[3],
-                "color": first_rec[4],
-                "code69": first_rec[5],
-                "sn4": first_rec[0][:4] if len(first_rec[0])>=4 else "", # 简单提取前4
-                "sku": sku,
-                "qty": len(records), # 实际记录数
-                "weight": weight,
-                "box_no": box_no,
-                "prod_date": first_rec[6][:10] if len(first_rec[6])>=10 else ""
-            }
-            
-            # 填充 SN 列表 (1, 2, 3...)
-            # 创建一个临时的 SN 列表，索引对应 box_sn_seq
-            # 假设 box_sn_seq 是 1-based (1,2,3...)
-            # 我们需要按照装箱序号正确填入位置
-            
-            # 初始化所有位置为空
-            full_box_qty = int(qty) if qty else len(records)
-            for i in range(1, full_box_qty + 1):
-                data_map[str(i)] = ""
-            
-            # 填入实际 SN
-            for rec in records:
-                sn = rec[0]
-                # 尝试用 box_sn_seq 作为位置，如果记录中没有序号(旧数据)，则按顺序填充
-                seq = rec[1]
-                if seq and int(seq) > 0:
-                    data_map[str(seq)] = sn
-                else:
-                    # 如果没有序号，按列表顺序找一个空位填充 (简单容错)
-                    pass 
-            
-            # 如果上面 seq 逻辑复杂，这里简化：直接按列表顺序填入 1..N
-            for i, rec in enumerate(records):
-                data_map[str(i+1)] = rec[0]
+        # 4. 构建打印数据
+        first_sn = records[0][0] or ""
+        data_map = {
+            "name": prod_name,
+            "spec": spec,
+            "model": model,
+            "color": color,
+            "code69": code69,
+            "sn4": first_sn[:4] if len(first_sn)>=4 else "", # 简单提取前4
+            "sku": sku,
+            "qty": len(records), # 实际记录数
+            "weight": weight,
+            "box_no": box_no,
+            "prod_date": time.strftime("%Y-%m-%d", time.gmtime(print_ts)) if print_ts else ""
+        }
+        
+        # 填充 SN 列表 (1, 2, 3...)
+        # 创建一个临时的 SN 列表，索引对应 box_sn_seq
+        # 假设 box_sn_seq 是 1-based (1,2,3...)
+        # 我们需要按照装箱序号正确填入位置
+        
+        # 初始化所有位置为空
+        full_box_qty = int(qty) if qty else len(records)
+        for i in range(1, full_box_qty + 1):
+            data_map[str(i)] = ""
+        
+        # 填入实际 SN
+        for rec in records:
+            sn = rec[0]
+            # 尝试用 box_sn_seq 作为位置，如果记录中没有序号(旧数据)，则按顺序填充
+            seq = rec[1]
+            if seq and int(seq) > 0:
+                data_map[str(seq)] = sn
+            else:
+                # 如果没有序号，按列表顺序找一个空位填充 (简单容错)
+                pass 
+        
+        # 如果上面 seq 逻辑复杂，这里简化：直接按列表顺序填入 1..N
+        for i, rec in enumerate(records):
+            data_map[str(i+1)] = rec[0]
 
-            # 4. 获取映射配置
-            mapping = self.db.get_setting('field_mapping')
-            from src.config import DEFAULT_MAPPING
-            if not isinstance(mapping, dict): mapping = DEFAULT_MAPPING
-            
-            # 转换键名
-            final_dat = {}
-            for k, v in mapping.items():
-                if k in data_map: final_dat[v] = data_map[k]
-            # 复制 SN 键 (1, 2, 3...)
-            for k, v in data_map.items():
-                if k.isdigit(): final_dat[k] = v
+        # 5. 获取映射配置
+        mapping = self.db.get_setting('field_mapping')
+        from src.config import DEFAULT_MAPPING
+        if not isinstance(mapping, dict): mapping = DEFAULT_MAPPING
+        
+        # 转换键名
+        final_dat = {}
+        for k, v in mapping.items():
+            if k in data_map: final_dat[v] = data_map[k]
+        # 复制 SN 键 (1, 2, 3...)
+        for k, v in data_map.items():
+            if k.isdigit(): final_dat[k] = v
 
-            # 5. 打印
-            root = self.db.get_setting('template_root')
-            full_path = os.path.join(root, tmpl_path) if root and tmpl_path else tmpl_path
-            
-            ok, msg = self.printer.print_label(full_path, final_dat)
-            if ok:
-                QMessageBox.information(self, "成功", "补打指令已发送")
-            else:
-                QMessageBox.critical(self, "打印失败", msg)
+        # 6. 模板完整路径
+        root = self.db.get_setting('template_root')
+        full_path = os.path.join(root, tmpl_path) if root and tmpl_path else tmpl_path
+        return full_path, final_dat
 
-        except Exception as e:
-            traceback.print_exc()
-            QMessageBox.critical(self, "系统错误", str(e))
+    def on_reprint_finished(self, job):
+        """打印线程回调：只处理本页提交的补打任务"""
+        if job.id not in self.reprint_jobs: return
+        self.reprint_jobs.discard(job.id)
+        if job.ok:
+            QMessageBox.information(self, "成功", f"箱号 [{job.context['box_no']}] 补打完成")
+        else:
+            QMessageBox.critical(self, "打印失败", job.msg)
     
-    # ... export_data 和 delete_records 保持不变 ...
     def export_data(self):
-        path, _ = QFileDialog.getSaveFileName(self, "导出", "print_history.xlsx", "Excel (*.xlsx)")
+        """按当前查询条件导出全部记录 (不限于表格已加载的行)"""
+        if self.export_worker and self.export_worker.isRunning():
+            return QMessageBox.warning(self, "提示", "正在导出，请稍候")
+        path, _ = QFileDialog.getSaveFileName(self, "导出", "print_history.xlsx", "Excel (*.xlsx);;CSV (*.csv)")
         if not path: return
-        try:
-            rows = []; headers = [self.table.horizontalHeaderItem(i).text() for i in range(self.table.columnCount())]
-            for r in range(self.table.rowCount()):
-                row_data = []
-                for c in range(self.table.columnCount()):
-                    item = self.table.item(r, c)
-                    row_data.append(item.text() if item else "")
-                rows.append(row_data)
-            if not rows: return QMessageBox.warning(self, "提示", "无数据")
-            df = pd.DataFrame(rows, columns=headers)
-            if "ID" in df.columns: df = df.drop(columns=["ID"])
-            df.to_excel(path, index=False)
-            QMessageBox.information(self, "成功", "导出成功")
-        except Exception as e: QMessageBox.critical(self, "错误", str(e))
+        where, params = self.model.filter()
+        self.export_dlg = QProgressDialog("正在导出...", "取消", 0, 100, self)
+        self.export_dlg.setWindowTitle("导出")
+        self.export_dlg.setWindowModality(Qt.WindowModal)
+        self.export_dlg.setMinimumDuration(0)
+        self.export_dlg.setValue(0)
+
+        w = ExportWorker(self.db, where, params, path, self)
+        w.progress.connect(self.on_export_progress)
+        w.done.connect(lambda n: self.on_export_end("成功", f"导出成功，共 {n} 条"))
+        w.failed.connect(lambda msg: self.on_export_end("错误", msg))
+        w.cancelled.connect(lambda: self.on_export_end("提示", "导出已取消"))
+        self.export_dlg.canceled.connect(w.cancel)
+        self.export_worker = w
+        w.start()
+
+    def on_export_progress(self, done, total):
+        self.export_dlg.setLabelText(f"正在导出... {done} / {total}")
+        self.export_dlg.setValue(int(done * 100 / total) if total else 100)
+
+    def on_export_end(self, title, msg):
+        self.export_dlg.reset()
+        if title == "错误": QMessageBox.critical(self, title, msg)
+        else: QMessageBox.information(self, title, msg)
 
     def delete_records(self):
         try:
-            rows = set(i.row() for i in self.table.selectedIndexes())
+            rows = [i.row() for i in self.table.selectionModel().selectedRows()]
             if not rows: return QMessageBox.warning(self, "提示", "未选中")
-            ids = [self.table.item(r, 0).text() for r in rows]
+            ids = [self.model.row_values(r)[0] for r in rows]
             if QMessageBox.question(self, "确认", f"删 {len(ids)} 条?", QMessageBox.Yes|QMessageBox.No) == QMessageBox.Yes:
-                p = ",".join("?" * len(ids))
-                self.db.cursor.execute(f"DELETE FROM records WHERE id IN ({p})", ids)
-                self.db.conn.commit()
-                self.load()
+                self.db.delete_records(ids)
+                self.model.reload()
         except Exception as e: QMessageBox.critical(self, "错误", str(e))
@@ -1,30 +1,74 @@
 import sys
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QPushButton, QStackedWidget, QLabel, QFrame)
-from PyQt5.QtCore import Qt
+                             QPushButton, QStackedWidget, QLabel, QFrame, QApplication, QMessageBox,
+                             QProgressDialog)
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QIcon
 from src.config import get_resource_path
 from src.version import APP_VERSION
 from src.database import Database
+from src.printer import printer_factory_from_settings
+from src.print_queue import PrintWorker
+from src import profiler
 
-# 导入各个页面
-from src.ui.product_page import ProductPage
-from src.ui.print_page import PrintPage
-# 兼容导入 RecordPage/HistoryPage
-try:
-    from src.ui.record_page import RecordPage as HistoryPage
-except ImportError:
-    from src.ui.history_page import HistoryPage
-# 兼容导入 SettingsPage
-try:
-    from src.ui.settings_page import SettingsPage
-except ImportError:
-    from src.ui.setting_page import SettingsPage
+# 流水线耗时统计写库间隔 (毫秒)
+METRICS_FLUSH_MS = 60000
+
+
+# 各页面模块在首次切换到该页时才导入并构建，缩短启动到窗口显示的时间
+def _build_product_page(db, worker):
+    from src.ui.product_page import ProductPage
+    return ProductPage(db)
+
+
+def _build_print_page(db, worker):
+    from src.ui.print_page import PrintPage
+    return PrintPage(db, worker)
+
+
+def _build_history_page(db, worker):
+    # 兼容导入 RecordPage/HistoryPage
+    try:
+        from src.ui.record_page import RecordPage as HistoryPage
+    except ImportError:
+        from src.ui.history_page import HistoryPage
+    return HistoryPage(db, worker)
+
+
+def _build_settings_page(db, worker):
+    # 兼容导入 SettingsPage
+    try:
+        from src.ui.settings_page import SettingsPage
+    except ImportError:
+        from src.ui.setting_page import SettingsPage
+    return SettingsPage(db)
+
+
+# 与导航按钮顺序一致: (属性名, 构建函数)
+PAGE_BUILDERS = [
+    ("product_page", _build_product_page),
+    ("print_page", _build_print_page),
+    ("history_page", _build_history_page),
+    ("settings_page", _build_settings_page),
+]
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.db = Database()
+        # 全进程共享的数据库连接 (写连接 + 只读连接)，注入各页面
+        # 升级需要分批迁移数据时显示进度 (主窗口尚未显示，使用独立对话框)
+        self.upgrade_dlg = None
+        with profiler.span("Database"):
+            self.db = Database(progress=self.on_db_upgrade_progress)
+        if self.upgrade_dlg is not None:
+            self.upgrade_dlg.close()
+            self.upgrade_dlg = None
+        
+        # 全进程共享的后台打印线程 (打印页与记录页补打共用)，后端由设置项 printer_backend 选择
+        # 窗口显示后才启动 (见下方 QTimer)，启动时预先打开上次使用的模板
+        self.print_worker = PrintWorker(printer_factory_from_settings(self.db),
+                                        warmup_path=self.db.get_setting('last_template'))
+        self.print_worker.ready.connect(self.on_printer_ready)
         
         # 尝试自动备份 (不阻塞界面)
         try:
@@ -119,16 +163,10 @@ class MainWindow(QMainWindow):
         self.stack = QStackedWidget()
         main_layout.addWidget(self.stack)
 
-        # 初始化各个页面
-        self.product_page = ProductPage()
-        self.print_page = PrintPage()
-        self.history_page = HistoryPage() 
-        self.settings_page = SettingsPage()
-
-        self.stack.addWidget(self.product_page)
-        self.stack.addWidget(self.print_page)
-        self.stack.addWidget(self.history_page)
-        self.stack.addWidget(self.settings_page)
+        # 先放占位控件，页面在首次切换时构建 (见 switch_page)
+        for attr, _ in PAGE_BUILDERS:
+            setattr(self, attr, None)
+            self.stack.addWidget(QWidget())
 
         # 绑定点击事件
         self.btn_product.clicked.connect(lambda: self.switch_page(0))
@@ -139,18 +177,95 @@ class MainWindow(QMainWindow):
         # 默认选中“打印标签”
         self.btn_print.click()
 
+        # 状态栏显示打印引擎状态；事件循环开始 (窗口已显示) 后再启动打印线程
+        self.lbl_engine = QLabel("打印引擎: 启动中...")
+        self.lbl_engine.setStyleSheet("color: #e67e22; padding-right: 10px;")
+        self.statusBar().addPermanentWidget(self.lbl_engine)
+        QTimer.singleShot(0, self.print_worker.start)
+        # 数据库升级中需要操作员知晓的事项 (如历史重复SN)
+        if self.db.notices:
+            QTimer.singleShot(0, self.show_db_notices)
+
+        # 定期把流水线耗时统计写入数据库 (性能诊断页读取)
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.flush_metrics)
+        self.metrics_timer.start(METRICS_FLUSH_MS)
+
+    def on_db_upgrade_progress(self, text, done, total):
+        if self.upgrade_dlg is None:
+            self.upgrade_dlg = QProgressDialog(text, None, 0, 100)
+            self.upgrade_dlg.setWindowTitle("数据库升级")
+            self.upgrade_dlg.setCancelButton(None)
+            self.upgrade_dlg.setWindowModality(Qt.ApplicationModal)
+            self.upgrade_dlg.setMinimumDuration(0)
+            self.upgrade_dlg.show()
+        self.upgrade_dlg.setLabelText(f"{text}\n请勿关闭程序 (中断后下次启动会从断点继续)")
+        # 总数未知时显示为忙碌状态
+        self.upgrade_dlg.setMaximum(100 if total else 0)
+        self.upgrade_dlg.setValue(int(done * 100 / total) if total else 0)
+        QApplication.processEvents()
+
+    def show_db_notices(self):
+        QMessageBox.warning(self, "数据库升级提示", "\n\n".join(self.db.notices))
+
+    def flush_metrics(self):
+        try:
+            self.db.flush_metrics()
+        except Exception as e:
+            print(f"Metrics Flush Error: {e}")
+
+    def on_printer_ready(self, ok, msg):
+        profiler.mark(f"打印引擎就绪: {msg}")
+        self.lbl_engine.setText(f"打印引擎: {msg}")
+        self.lbl_engine.setStyleSheet(f"color: {'green' if ok else 'red'}; padding-right: 10px;")
+
+    def _ensure_page(self, index):
+        """返回第 index 页，未构建时先构建并替换占位控件；返回 (页面, 是否新建)"""
+        attr, builder = PAGE_BUILDERS[index]
+        page = getattr(self, attr)
+        if page is not None: return page, False
+        with profiler.span(f"构建页面 {attr}"):
+            page = builder(self.db, self.print_worker)
+        placeholder = self.stack.widget(index)
+        self.stack.insertWidget(index, page)
+        self.stack.removeWidget(placeholder)
+        placeholder.deleteLater()
+        setattr(self, attr, page)
+        return page, True
+
     def switch_page(self, index):
+        current_widget, created = self._ensure_page(index)
         self.stack.setCurrentIndex(index)
-        # 切换页面时刷新数据
-        current_widget = self.stack.widget(index)
-        if hasattr(current_widget, 'refresh_data'):
+        # 切换页面时刷新数据 (新建的页面构造时已加载过)
+        if not created and hasattr(current_widget, 'refresh_data'):
             current_widget.refresh_data()
 
     def closeEvent(self, event):
-        # 关闭时释放打印机资源
-        if hasattr(self, 'print_page') and hasattr(self.print_page, 'printer'):
-            try:
-                self.print_page.printer.quit()
-            except:
-                pass
+        # 关闭时等待打印队列完成并释放打印机资源 (COM 对象在打印线程内释放)
+        try:
+            self.print_worker.stop()
+            # 处理打印线程已发出但尚未送达的完成信号 (写入最后几箱的记录)
+            QApplication.processEvents()
+        except:
+            pass
+        # 已打印但写库失败的箱最后重试一次，仍失败时告知操作员箱号 (需人工补录)
+        try:
+            if self.print_page is not None and self.print_page.retry_unsaved():
+                boxes = ", ".join(j.context['box_no'] for j in self.print_page.unsaved_jobs)
+                QMessageBox.critical(self, "记录未保存", f"以下箱已打印但记录仍未保存，请记下箱号人工处理:\n{boxes}")
+        except:
+            pass
+        # 归还本工位预留但未使用的箱号流水号
+        try:
+            if self.print_page is not None:
+                self.print_page.rule_engine.release_blocks()
+        except:
+            pass
+        # 写入最后一个时间片的耗时统计，最后关闭共享数据库连接
+        self.metrics_timer.stop()
+        self.flush_metrics()
+        try:
+            self.db.close()
+        except:
+            pass
         super().closeEvent(event)
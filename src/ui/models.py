@@ -0,0 +1,171 @@
+from collections import OrderedDict
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QSortFilterProxyModel
+
+
+class HistoryTableModel(QAbstractTableModel):
+    """
+    打印记录表格模型。
+    按 id 倒序做键集分页，滚动到底部时由视图调用 fetchMore 继续加载；
+    只缓存最近访问的若干页，已淘汰的页按记下的分页边界重新查询，内存占用与总记录数无关。
+    """
+    HEADERS = ["ID", "箱号", "序号", "名称", "规格", "型号", "颜色", "SN", "69码", "时间"]
+    PAGE_SIZE = 500
+    MAX_CACHED_PAGES = 20
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._where, self._params = db.history_filter()
+        self._reset_pages()
+
+    def _reset_pages(self):
+        self._bounds = [None]        # 第 k 页从 id < _bounds[k] 开始取
+        self._pages = OrderedDict()  # 页号 -> 行元组列表 (LRU)
+        self._rows = 0
+        self._more = True
+
+    def set_filter(self, where, params):
+        """更换过滤条件并重新加载第一页"""
+        self.beginResetModel()
+        self._where, self._params = where, list(params)
+        self._reset_pages()
+        self.endResetModel()
+        if self.canFetchMore(): self.fetchMore()
+
+    def reload(self):
+        self.set_filter(self._where, self._params)
+
+    def filter(self):
+        return self._where, list(self._params)
+
+    def _load_page(self, page):
+        rows = self._pages.get(page)
+        if rows is None:
+            rows = self.db.history_page(self._where, self._params, self._bounds[page], self.PAGE_SIZE)
+            self._pages[page] = rows
+            while len(self._pages) > self.MAX_CACHED_PAGES:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(page)
+        return rows
+
+    def row_values(self, row):
+        """返回某行的原始数据元组 (列顺序同 HEADERS)"""
+        rows = self._load_page(row // self.PAGE_SIZE)
+        i = row % self.PAGE_SIZE
+        return rows[i] if i < len(rows) else None
+
+    # --- QAbstractTableModel 接口 ---
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._rows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole: return None
+        row = self.row_values(index.row())
+        if row is None: return None
+        val = row[index.column()]
+        # 时间列为 print_day (yyyyMMdd 整数)，直接显示
+        return str(val) if val is not None else ""
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self._more: return
+        page = len(self._bounds) - 1
+        try:
+            rows = self.db.history_page(self._where, self._params, self._bounds[page], self.PAGE_SIZE)
+        except Exception as e:
+            print(f"History Fetch Error: {e}")
+            self._more = False
+            return
+        if len(rows) < self.PAGE_SIZE: self._more = False
+        if not rows: return
+        self.beginInsertRows(QModelIndex(), self._rows, self._rows + len(rows) - 1)
+        self._pages[page] = rows
+        self._bounds.append(rows[-1][0])
+        self._rows += len(rows)
+        while len(self._pages) > self.MAX_CACHED_PAGES:
+            self._pages.popitem(last=False)
+        self.endInsertRows()
+
+
+class ProductListModel(QAbstractTableModel):
+    """
+    打印页产品列表模型。
+    产品连同箱号规则、SN规则名称一次查询载入，每行只存一个元组；选中时再转成 dict。
+    """
+    HEADERS = ["名称", "规格", "颜色", "69码", "SN前4", "箱规"]
+    DISPLAY_FIELDS = ("name", "spec", "color", "code69", "sn4", "box_rule_name")
+    SQL = """
+        SELECT p.*, br.name AS box_rule_name, sr.name AS sn_rule_name
+        FROM products p
+        LEFT JOIN box_rules br ON br.id = p.rule_id
+        LEFT JOIN sn_rules sr ON sr.id = p.sn_rule_id
+        ORDER BY p.name
+    """
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.fields = ()
+        self.rows = []
+        self.search_keys = [] # 每行预先小写化的 "名称\x0069码"，过滤时不再查库
+        self._display_idx = ()
+
+    def reload(self):
+        cur = self.db.read_conn.execute(self.SQL)
+        fields = tuple(d[0] for d in cur.description)
+        rows = cur.fetchall()
+        ni, ci = fields.index("name"), fields.index("code69")
+        self.beginResetModel()
+        self.fields, self.rows = fields, rows
+        self.search_keys = [f"{r[ni] or ''}\x00{r[ci] or ''}".lower() for r in rows]
+        self._display_idx = tuple(fields.index(f) for f in self.DISPLAY_FIELDS)
+        self.endResetModel()
+
+    def product(self, row):
+        """返回某行产品信息 dict (含 box_rule_name / sn_rule_name)"""
+        if not 0 <= row < len(self.rows): return None
+        return dict(zip(self.fields, self.rows[row]))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole: return None
+        val = self.rows[index.row()][self._display_idx[index.column()]]
+        if val is None: return "无" if index.column() == 5 else ""
+        return str(val)
+
+
+class ProductFilterProxy(QSortFilterProxyModel):
+    """按名称 / 69码子串过滤产品 (纯内存)"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._keyword = ""
+
+    def set_keyword(self, text):
+        k = text.lower()
+        if k == self._keyword: return
+        self._keyword = k
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        return not self._keyword or self._keyword in self.sourceModel().search_keys[source_row]
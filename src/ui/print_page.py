@@ -1,39 +1,49 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, 
                              QListWidget, QPushButton, QComboBox, QDateEdit, QGroupBox,
-                             QMessageBox, QTableWidget, QTableWidgetItem, QHeaderView,
+                             QMessageBox, QTableView, QHeaderView,
                              QAbstractItemView, QGridLayout)
 from PyQt5.QtCore import QDate, Qt, QTimer # 修正：添加 QTimer
-from src.database import Database
 from src.box_rules import BoxRuleEngine
-from src.bartender import BartenderPrinter
+from src.sn_rules import SnRuleEngine
+from src.print_queue import PrintJob
 from src.config import DEFAULT_MAPPING
-# 修正：添加 AppUpdater 引入
-try:
-    from src.utils.updater import AppUpdater
-except ImportError:
-    AppUpdater = None
+from src.ui.models import ProductListModel, ProductFilterProxy
 
 import datetime
 import os
-import re
+import sqlite3
+import time
 import traceback
 
 class PrintPage(QWidget):
-    def __init__(self):
+    def __init__(self, db, print_worker):
         super().__init__()
-        self.db = Database()
+        self.db = db
         self.rule_engine = BoxRuleEngine(self.db)
-        self.printer = BartenderPrinter()
+        self.sn_engine = SnRuleEngine(self.db)
+        # 后台打印线程：COM 对象在该线程内创建，扫码不再等待打印
+        self.print_worker = print_worker
+        self.print_worker.job_finished.connect(self.on_print_finished)
+        self.pending_jobs = {} # job_id -> PrintJob (已提交、未完成)
+        self.unsaved_jobs = [] # 已打印但记录写库失败的任务 (保留打印数据，稍后重试保存)
         self.current_product = None
         self.current_sn_list = [] 
         self.current_box_no = ""
         
         self.init_ui()
         self.refresh_data()
+        # 后台加载已打印 SN 过滤器，扫码查重优先走内存
+        self.db.load_sn_filter()
         
-        # 修正：添加软件更新检查
-        if AppUpdater:
-            QTimer.singleShot(2000, lambda: AppUpdater.check_update(self))
+        # 修正：添加软件更新检查 (requests 较重，延迟到检查时再导入)
+        QTimer.singleShot(2000, self.check_update)
+
+    def check_update(self):
+        try:
+            from src.utils.updater import AppUpdater
+        except ImportError:
+            return
+        AppUpdater.check_update(self)
 
     def init_ui(self):
         # 0. 主布局
@@ -57,9 +67,12 @@ class PrintPage(QWidget):
         v_left.addWidget(self.input_search)
 
         # 1.2 产品列表
-        self.table_product = QTableWidget()
-        self.table_product.setColumnCount(6)
-        self.table_product.setHorizontalHeaderLabels(["名称", "规格", "颜色", "69码", "SN前4", "箱规"])
+        # 产品列表：模型一次载入，搜索只在内存中过滤
+        self.product_model = ProductListModel(self.db, self)
+        self.product_proxy = ProductFilterProxy(self)
+        self.product_proxy.setSourceModel(self.product_model)
+        self.table_product = QTableView()
+        self.table_product.setModel(self.product_proxy)
         
         # 修正：产品列表行高调整至
         header = self.table_product.horizontalHeader()
@@ -72,7 +85,7 @@ class PrintPage(QWidget):
         self.table_product.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.table_product.setMaximumHeight(150)
         self.table_product.setStyleSheet("margin-bottom: 0px;") 
-        self.table_product.itemClicked.connect(self.on_product_select)
+        self.table_product.clicked.connect(self.on_product_select)
         v_left.addWidget(self.table_product)
 
         # 增加空白区域
@@ -166,6 +179,7 @@ class PrintPage(QWidget):
         self.combo_repair = QComboBox(); self.combo_repair.addItems([str(i) for i in range(10)])
         self.combo_repair.setStyleSheet(style_big_ctrl)
         self.combo_repair.currentIndexChanged.connect(self.update_box_preview)
+        self.combo_repair.currentIndexChanged.connect(self.prepare_sn_rule)
         
         l_date = QLabel("日期:"); l_date.setStyleSheet(style_big_lbl)
         l_batch = QLabel("批次:"); l_batch.setStyleSheet(style_big_lbl)
@@ -251,36 +265,17 @@ class PrintPage(QWidget):
     # --- 逻辑功能 ---
 
     def refresh_data(self):
-        self.p_cache = []
         try:
-            c = self.db.conn.cursor()
-            c.execute("SELECT * FROM products ORDER BY name")
-            cols = [d[0] for d in c.description]
-            for r in c.fetchall(): self.p_cache.append(dict(zip(cols,r)))
-            self.filter_products()
-        except: pass
+            self.product_model.reload()
+        except Exception as e:
+            print(f"Load Products Error: {e}")
 
     def filter_products(self):
-        k = self.input_search.text().lower()
-        self.table_product.setRowCount(0)
-        for p in self.p_cache:
-            if k in p['name'].lower() or k in p['code69'].lower():
-                r = self.table_product.rowCount(); self.table_product.insertRow(r)
-                it = QTableWidgetItem(p['name']); it.setData(Qt.UserRole, p)
-                self.table_product.setItem(r,0,it)
-                self.table_product.setItem(r,1,QTableWidgetItem(p.get('spec','')))
-                self.table_product.setItem(r,2,QTableWidgetItem(p.get('color','')))
-                self.table_product.setItem(r,3,QTableWidgetItem(p['code69']))
-                self.table_product.setItem(r,4,QTableWidgetItem(p['sn4']))
-                rn = "无"
-                if p.get('rule_id'):
-                    c=self.db.conn.cursor(); c.execute("SELECT name FROM box_rules WHERE id=?",(p['rule_id'],))
-                    res=c.fetchone(); rn=res[0] if res else "无"
-                self.table_product.setItem(r,5,QTableWidgetItem(rn))
-
-    def on_product_select(self, item):
-        if not item: return
-        p = self.table_product.item(item.row(),0).data(Qt.UserRole)
+        self.product_proxy.set_keyword(self.input_search.text())
+
+    def on_product_select(self, index):
+        if not index.isValid(): return
+        p = self.product_model.product(self.product_proxy.mapToSource(index).row())
         if not p: return
 
         self.current_product = p
@@ -296,22 +291,10 @@ class PrintPage(QWidget):
         tmpl = p.get('template_path','')
         self.lbl_tmpl_name.setText(os.path.basename(tmpl) if tmpl else "未设置")
         
-        rid = p.get('rule_id',0)
-        rname = "无"
-        if rid:
-             c=self.db.conn.cursor(); c.execute("SELECT name FROM box_rules WHERE id=?",(rid,))
-             res=c.fetchone(); rname=res[0] if res else "无"
-        self.lbl_box_rule_name.setText(rname)
-        
-        self.current_sn_rule = None
-        sn_rule_name = "无"
-        if p.get('sn_rule_id'):
-             c=self.db.conn.cursor(); c.execute("SELECT name, rule_string, length FROM sn_rules WHERE id=?",(p['sn_rule_id'],))
-             res=c.fetchone()
-             if res: 
-                 sn_rule_name = res[0]
-                 self.current_sn_rule={'fmt':res[1], 'len':res[2]}
-        self.lbl_sn_rule.setText(sn_rule_name)
+        # 规则名称已随产品列表联表查出
+        self.lbl_box_rule_name.setText(p.get('box_rule_name') or "无")
+        self.lbl_sn_rule.setText(p.get('sn_rule_name') or "无")
+        self.prepare_sn_rule()
 
         # 重置列表和状态
         self.current_sn_list=[]; 
@@ -319,13 +302,11 @@ class PrintPage(QWidget):
         self.update_box_preview(); self.update_daily(); self.input_sn.setFocus()
         
         # 重置状态标签为未打印
-        self.lbl_print_status.setText("未打印")
-        self.lbl_print_status.setStyleSheet("font-size: 40px; font-weight: bold; color: red; border: 2px solid #ddd; border-radius: 8px; background-color: #f9f9f9; padding: 10px; min-height: 100px;")
+        self.set_print_status("未打印")
 
     def update_box_preview(self):
         if not self.current_product: return
         try:
-            pid = self.current_product.get('id')
             rid = self.current_product.get('rule_id',0)
             rl = int(self.combo_repair.currentText())
             s, _ = self.rule_engine.generate_box_no(rid, self.current_product, rl)
@@ -334,42 +315,28 @@ class PrintPage(QWidget):
         except Exception as e:
             self.lbl_box_no.setText("规则错误")
 
+    def set_print_status(self, text, color="red", bg="#f9f9f9"):
+        self.lbl_print_status.setText(text)
+        self.lbl_print_status.setStyleSheet(f"font-size: 40px; font-weight: bold; color: {color}; border: 2px solid #ddd; border-radius: 8px; background-color: {bg}; padding: 10px; min-height: 100px;")
+
     def update_daily(self):
         if not self.current_product: return
-        d = datetime.datetime.now().strftime("%Y-%m-%d")+"%"
         try:
-            c=self.db.conn.cursor()
-            c.execute("SELECT COUNT(DISTINCT box_no) FROM records WHERE name=? AND print_date LIKE ?", (self.current_product['name'], d))
-            self.lbl_daily.setText(f"今日: {c.fetchone()[0]}")
+            # 每日装箱数由汇总表维护，这里只是一次主键查询
+            self.lbl_daily.setText(f"今日: {self.db.get_daily_boxes(self.current_product['name'])}")
         except: pass
 
+    def sn_rule_key(self):
+        p = self.current_product
+        return (p.get('sn_rule_id') or 0, p.get('sn4', ''), self.combo_repair.currentText())
+
+    def prepare_sn_rule(self):
+        """选择产品或切换批次时预编译 SN 规则 (结果缓存在引擎中)"""
+        if self.current_product: self.sn_engine.get(*self.sn_rule_key())
+
     def validate_sn(self, sn):
-        sn = re.sub(r'[\s\W\u200b\ufeff]+$', '', sn); sn = sn.strip() 
-        prefix = str(self.current_product.get('sn4', '')).strip()
-        if not sn.startswith(prefix): return False, f"前缀不符！\n要求: {prefix}"
-        
-        if self.current_sn_rule:
-            fmt = self.current_sn_rule['fmt']; mlen = self.current_sn_rule['len']
-            if mlen > 0 and len(sn) != mlen: return False, f"长度错误！\n要求: {mlen}位"
-            
-            parts = re.split(r'(\{SN4\}|\{BATCH\}|\{SEQ\d+\})', fmt)
-            regex_parts = []
-            current_batch = self.combo_repair.currentText()
-            
-            for part in parts:
-                if part == "{SN4}": regex_parts.append(re.escape(prefix))
-                elif part == "{BATCH}": regex_parts.append(re.escape(current_batch))
-                elif part.startswith("{SEQ") and part.endswith("}"):
-                    match = re.search(r'\{SEQ(\d+)\}', part)
-                    if match: regex_parts.append(f"\\d{{{int(match.group(1))}}}")
-                    else: return False, "规则错误"
-                else:
-                    if part: regex_parts.append(re.escape(part))
-            
-            try:
-                if not re.match("^" + "".join(regex_parts) + "$", sn): return False, f"格式不符！\nSN: {sn}"
-            except: return False, "正则错误"
-        return True, ""
+        # 规则已按 (规则ID, SN前4, 批次) 预编译；设置页修改规则后缓存自动失效并在此重新编译
+        return self.sn_engine.validate(self.sn_engine.get(*self.sn_rule_key()), sn)
 
     def update_sn_list_ui(self):
         self.list_sn.clear()
@@ -385,17 +352,21 @@ class PrintPage(QWidget):
         sn = sn.upper()
 
         if sn in [x[0] for x in self.current_sn_list]: return QMessageBox.warning(self,"错","重复扫描")
-        if self.db.check_sn_exists(sn): return QMessageBox.warning(self,"错","已打印过")
-        
-        ok, msg = self.validate_sn(sn)
+        # 已提交打印但尚未写库的箱子
+        if any(sn in j.context['sns'] for j in self.pending_jobs.values()): return QMessageBox.warning(self,"错","该SN正在打印中")
+        if any(sn in j.context['sns'] for j in self.unsaved_jobs): return QMessageBox.warning(self,"错","该SN已打印，记录待保存")
+        metrics = self.db.metrics
+        with metrics.timer('dup_check'): exists = self.db.check_sn_exists(sn)
+        if exists: return QMessageBox.warning(self,"错","已打印过")
+        
+        with metrics.timer('validate'): ok, msg = self.validate_sn(sn)
         if not ok: return QMessageBox.warning(self,"校验失败", msg)
         
         self.current_sn_list.append((sn, datetime.datetime.now()))
         self.update_sn_list_ui()
         
-        # 只要开始扫描新的，状态就变回“未打印”
-        self.lbl_print_status.setText("未打印")
-        self.lbl_print_status.setStyleSheet("font-size: 40px; font-weight: bold; color: red; border: 2px solid #ddd; border-radius: 8px; background-color: #f9f9f9; padding: 10px; min-height: 100px;")
+        # 只要开始扫描新的，状态就变回“未打印” (仍有箱子在打印时保持显示打印中)
+        if not self.pending_jobs: self.set_print_status("未打印")
         
         if len(self.current_sn_list) >= self.current_product['qty']: self.print_label()
 
@@ -415,6 +386,16 @@ class PrintPage(QWidget):
     def print_label(self):
         if not self.current_product or not self.current_sn_list: return
         p = self.current_product
+        metrics = self.db.metrics
+        
+        # 占用流水号 (从本工位预留的号段中发出)，生成本箱箱号
+        rl = int(self.combo_repair.currentText())
+        with metrics.timer('take_seq'):
+            seq_key = self.rule_engine.counter_key(p['rule_id'], p['id'], rl)
+            seq = self.rule_engine.take_sequence(seq_key)
+            self.current_box_no, _ = self.rule_engine.generate_box_no(p['rule_id'], p, rl, seq)
+        
+        t_payload = time.perf_counter()
         m = self.db.get_setting('field_mapping')
         if not isinstance(m, dict): m = DEFAULT_MAPPING
         
@@ -449,28 +430,103 @@ class PrintPage(QWidget):
         tp = p.get('template_path','')
         path = os.path.join(root, tp) if root and tp else tp
         
-        # 调用底层打印
-        ok, msg = self.printer.print_label(path, dat)
-        
-        if ok:
-            # 1. 更新数据库记录
-            now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            # 修正：记录正确的 box_sn_seq (序号从 1 开始)
-            for i, (sn,_) in enumerate(self.current_sn_list):
-                self.db.cursor.execute("INSERT INTO records (box_no, box_sn_seq, name, spec, model, color, code69, sn, print_date) VALUES (?,?,?,?,?,?,?,?,?)",
-                                       (self.current_box_no, i+1, p['name'], p['spec'], p['model'], p['color'], p['code69'], sn, now))
-            self.db.conn.commit()
-            self.rule_engine.commit_sequence(p['rule_id'], p['id'], int(self.combo_repair.currentText()))
-            
-            # 2. 更新UI状态：显示“打印完成” (绿色)
-            self.lbl_print_status.setText("打印完成")
-            self.lbl_print_status.setStyleSheet("font-size: 40px; font-weight: bold; color: green; border: 2px solid #ddd; border-radius: 8px; background-color: #e8f8f5; padding: 10px; min-height: 100px;")
-            
-            # 3. 清空列表并刷新
-            self.current_sn_list=[]; 
-            self.update_sn_list_ui()
+        # 提交到后台打印队列；记录在打印成功后才写入，失败放弃时流水号退回
+        job = PrintJob(path, dat, self.db.get_setting('default_printer'), context={
+            'product': p, 'box_no': self.current_box_no, 'seq': seq, 'seq_key': seq_key, 'repair_level': rl,
+            'sns': [sn for sn, _ in self.current_sn_list], 't_submit': time.perf_counter(),
+        })
+        metrics.record('payload', job.context['t_submit'] - t_payload)
+        self.pending_jobs[job.id] = job
+        self.print_worker.submit(job)
+        if self.print_worker.engine_ok is None:
+            # 打印引擎仍在后台启动，任务在队列中等待，启动完成后自动打印
+            self.set_print_status(f"等待打印引擎({len(self.pending_jobs)})", "#e67e22", "#fef5e7")
+        else:
+            self.set_print_status(f"打印中({len(self.pending_jobs)})", "#e67e22", "#fef5e7")
+        
+        # 立即清空列表并预览下一箱，操作员可继续扫描
+        self.current_sn_list=[]; 
+        self.update_sn_list_ui()
+        self.update_box_preview()
+
+    def on_print_finished(self, job):
+        """打印线程回调 (界面线程执行)"""
+        if job.id not in self.pending_jobs: return # 其他页面提交的任务
+        ctx = job.context
+        if not job.ok:
+            retry = QMessageBox.question(self, "打印失败", f"箱号 [{ctx['box_no']}] 打印失败:\n{job.msg}\n\n是否重试？\n(选否将放弃此箱，需重新扫描)",
+                                         QMessageBox.Yes|QMessageBox.No)
+            if retry == QMessageBox.Yes:
+                self.print_worker.submit(job)
+                return
+            self.pending_jobs.pop(job.id, None)
+            self.rule_engine.return_sequence(ctx['seq_key'], ctx['seq'])
+            if self.unsaved_jobs or self.pending_jobs: self.update_print_status()
+            else: self.set_print_status("打印失败")
             self.update_box_preview()
-            self.update_daily()
-            
-        else: 
-            QMessageBox.critical(self,"失败", msg)
+            return
+
+        self.pending_jobs.pop(job.id, None)
+        metrics = self.db.metrics
+        metrics.record('print', job.elapsed)
+        # 记住最近使用的模板，下次启动时预先打开
+        if job.template_path and self.db.get_setting('last_template') != job.template_path:
+            self.db.set_setting('last_template', job.template_path)
+        # 1. 更新数据库记录 (流水号已在提交时占用，无需再写计数器)；先补存之前写库失败的箱
+        ctx['print_date'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.retry_unsaved()
+        self.save_printed_box(job)
+        
+        # 2. 更新UI状态 & 3. 刷新箱号与今日统计
+        self.update_print_status()
+        self.update_box_preview()
+        self.update_daily()
+
+    def save_box(self, job):
+        """写入已打印箱的记录；成功时记录耗时统计"""
+        ctx = job.context
+        metrics = self.db.metrics
+        with metrics.timer('db_commit'):
+            self.db.save_box_records(ctx['box_no'], ctx['product'], ctx['sns'], ctx['print_date'], ctx['repair_level'],
+                                     payload=(job.template_path, job.data_map))
+        # 整箱耗时含排队等待、失败重试与写库重试
+        metrics.record('box_total', time.perf_counter() - ctx['t_submit'])
+        metrics.box_done()
+
+    def save_printed_box(self, job):
+        """保存一箱记录；数据库忙等错误时询问重试，放弃则暂存到 unsaved_jobs。返回是否已保存"""
+        box_no = job.context['box_no']
+        while True:
+            try:
+                self.save_box(job)
+                return True
+            except sqlite3.IntegrityError:
+                # SN 唯一约束拦截：整箱记录已回滚
+                QMessageBox.critical(self, "错误", f"箱号 [{box_no}] 记录保存失败：箱内存在已打印过的SN")
+                return False
+            except sqlite3.Error as e:
+                retry = QMessageBox.question(self, "记录未保存",
+                                             f"箱号 [{box_no}] 已打印，但记录保存失败:\n{e}\n\n是否立即重试保存？\n(选否将暂存此箱，下一箱打印完成或退出时自动重试)",
+                                             QMessageBox.Yes|QMessageBox.No)
+                if retry != QMessageBox.Yes:
+                    self.unsaved_jobs.append(job)
+                    return False
+
+    def retry_unsaved(self):
+        """静默重试暂存的未保存箱 (仍失败的继续暂存)；返回剩余数量"""
+        jobs, self.unsaved_jobs = self.unsaved_jobs, []
+        for job in jobs:
+            try:
+                self.save_box(job)
+            except sqlite3.IntegrityError:
+                QMessageBox.critical(self, "错误", f"箱号 [{job.context['box_no']}] 记录保存失败：箱内存在已打印过的SN")
+            except sqlite3.Error as e:
+                print(f"Retry Save Error: {e}")
+                self.unsaved_jobs.append(job)
+        return len(self.unsaved_jobs)
+
+    def update_print_status(self):
+        """按队列与未保存箱数更新状态：有未保存记录时红色提示，队列清空时显示“打印完成” (绿色)"""
+        if self.unsaved_jobs: self.set_print_status(f"记录未保存({len(self.unsaved_jobs)})", "red", "#fdedec")
+        elif self.pending_jobs: self.set_print_status(f"打印中({len(self.pending_jobs)})", "#e67e22", "#fef5e7")
+        else: self.set_print_status("打印完成", "green", "#e8f8f5")
@@ -1,16 +1,15 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, 
                              QTableWidgetItem, QPushButton, QHeaderView, 
                              QDialog, QFormLayout, QLineEdit, QSpinBox, 
-                             QFileDialog, QMessageBox, QComboBox, QAbstractItemView)
+                             QFileDialog, QMessageBox, QComboBox, QAbstractItemView, QInputDialog)
 from PyQt5.QtCore import Qt
-from src.database import Database
-import pandas as pd
+from src import product_import
 import os
 
 class ProductPage(QWidget):
-    def __init__(self):
+    def __init__(self, db):
         super().__init__()
-        self.db = Database()
+        self.db = db
         self.layout = QVBoxLayout(self)
         
         # Toolbar
@@ -43,7 +42,7 @@ class ProductPage(QWidget):
     def refresh_data(self):
         self.table.setRowCount(0)
         try:
-            cursor = self.db.conn.cursor()
+            cursor = self.db.read_conn.cursor()
             cursor.execute("SELECT * FROM products ORDER BY id DESC")
             for r_idx, row in enumerate(cursor.fetchall()):
                 self.table.insertRow(r_idx)
@@ -56,7 +55,7 @@ class ProductPage(QWidget):
         except Exception as e: print(f"Refresh error: {e}")
 
     def add_product(self):
-        dlg = ProductDialog(self)
+        dlg = ProductDialog(self.db, self)
         if dlg.exec_():
             d = dlg.get_data()
             try:
@@ -77,7 +76,7 @@ class ProductPage(QWidget):
         row = cursor.fetchone()
         if not row: return
 
-        dlg = ProductDialog(self, row)
+        dlg = ProductDialog(self.db, self, row)
         if dlg.exec_():
             d = dlg.get_data() + (pid,)
             try:
@@ -96,38 +95,40 @@ class ProductPage(QWidget):
                 self.db.cursor.execute("DELETE FROM products WHERE id=?", (pid,))
                 self.db.conn.commit(); self.refresh_data()
 
+    IMPORT_MODES = [("仅新增 (SN前4已存在则跳过)", product_import.MODE_INSERT),
+                    ("新增并更新已有产品 (按SN前4)", product_import.MODE_UPSERT),
+                    ("仅校验，不写入", product_import.MODE_DRY_RUN)]
+
     def import_data(self):
-        p, _ = QFileDialog.getOpenFileName(self, "导入", "", "Excel (*.xlsx *.xls)")
+        p, _ = QFileDialog.getOpenFileName(self, "导入", "", "Excel (*.xlsx *.xls);;CSV (*.csv)")
         if not p: return
+        labels = [m[0] for m in self.IMPORT_MODES]
+        label, ok = QInputDialog.getItem(self, "导入方式", "请选择导入方式:", labels, 0, False)
+        if not ok: return
+        mode = self.IMPORT_MODES[labels.index(label)][1]
         try:
-            df = pd.read_excel(p)
-            if 'name' not in df.columns or 'sn4' not in df.columns: return QMessageBox.warning(self,"错","缺列")
-            s, f = 0, 0
-            for _, r in df.iterrows():
-                try:
-                    val = (
-                        str(r['name']), str(r.get('spec','')), str(r.get('model','')), str(r.get('color','')), 
-                        str(r['sn4']), str(r.get('sku','')), str(r.get('code69','')), int(r.get('qty',1)), 
-                        str(r.get('weight','')), str(r.get('template_path','')), int(r.get('rule_id',0)), int(r.get('sn_rule_id',0))
-                    )
-                    self.db.cursor.execute('''INSERT INTO products (name, spec, model, color, sn4, sku, code69, qty, weight, template_path, rule_id, sn_rule_id) 
-                        VALUES (?,?,?,?,?,?,?,?,?,?,?,?)''', val)
-                    s += 1
-                except: f += 1
-            self.db.conn.commit(); self.refresh_data()
-            QMessageBox.information(self, "结果", f"成功: {s}, 失败: {f}")
+            df = product_import.read_catalog(p)
+            res = product_import.import_products(self.db, df, mode, product_import.default_report_path(p))
+            if mode != product_import.MODE_DRY_RUN: self.refresh_data()
+            head = "校验结果 (未写入)" if mode == product_import.MODE_DRY_RUN else "导入结果"
+            msg = f"新增: {res['inserted']}, 更新: {res['updated']}, 拒绝: {res['rejected']}"
+            if res['report']: msg += f"\n\n拒绝原因见报告:\n{res['report']}"
+            QMessageBox.information(self, head, msg)
+        except ValueError as e: QMessageBox.warning(self, "错", str(e))
         except Exception as e: QMessageBox.critical(self, "错", str(e))
 
     def export_data(self):
         p, _ = QFileDialog.getSaveFileName(self, "导出", "products.xlsx", "Excel (*.xlsx)")
-        if p: pd.read_sql_query("SELECT * FROM products", self.db.conn).to_excel(p, index=False); QMessageBox.information(self,"好","成功")
+        if not p: return
+        import pandas as pd # 仅导出时加载
+        pd.read_sql_query("SELECT * FROM products", self.db.read_conn).to_excel(p, index=False); QMessageBox.information(self,"好","成功")
 
 class ProductDialog(QDialog):
-    def __init__(self, parent=None, data=None):
+    def __init__(self, db, parent=None, data=None):
         super().__init__(parent)
         self.setWindowTitle("产品编辑")
         self.layout = QFormLayout(self)
-        self.db = Database()
+        self.db = db # 复用页面的共享连接，不再每次打开对话框都新建
         self.inputs = {}
         
         # 字段定义 (Name, DB Index)
@@ -151,15 +152,16 @@ class ProductDialog(QDialog):
 
         # Box Rule
         self.cb_box = QComboBox(); self.cb_box.addItem("无", 0)
-        self.db.cursor.execute("SELECT id, name FROM box_rules")
-        for r in self.db.cursor.fetchall(): self.cb_box.addItem(r[1], r[0])
+        c = self.db.read_conn.cursor()
+        c.execute("SELECT id, name FROM box_rules")
+        for r in c.fetchall(): self.cb_box.addItem(r[1], r[0])
         if data: idx = self.cb_box.findData(data[11]); self.cb_box.setCurrentIndex(idx if idx>=0 else 0)
         self.layout.addRow("箱号规则", self.cb_box)
 
         # SN Rule (New)
         self.cb_sn = QComboBox(); self.cb_sn.addItem("无", 0)
-        self.db.cursor.execute("SELECT id, name FROM sn_rules")
-        for r in self.db.cursor.fetchall(): self.cb_sn.addItem(r[1], r[0])
+        c.execute("SELECT id, name FROM sn_rules")
+        for r in c.fetchall(): self.cb_sn.addItem(r[1], r[0])
         if data: 
             # data[12] 是 sn_rule_id，如果数据库结构刚变，可能需要 try/except 处理旧数据
             try:
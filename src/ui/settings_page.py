@@ -1,20 +1,26 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QFormLayout, QLineEdit, QPushButton, 
                              QMessageBox, QTextEdit, QGroupBox, QHBoxLayout, 
                              QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView,
-                             QTabWidget, QLabel, QFileDialog, QComboBox, QSpinBox)
+                             QTabWidget, QLabel, QFileDialog, QComboBox, QSpinBox, QApplication)
 from PyQt5.QtCore import Qt
 # --- 新增导入：用于获取打印机信息 ---
 from PyQt5.QtPrintSupport import QPrinterInfo 
 # -----------------------------------
-from src.database import Database
 from src.config import DEFAULT_MAPPING
+from src.printer import PRINTER_BACKENDS, DEFAULT_BACKEND, DEFAULT_FORMAT_CACHE_SIZE
+from src.metrics import STAGES
+from src.box_rules import DEFAULT_BLOCK_SIZE
 import json
 import os
+import time
+
+# 性能诊断统计范围: (显示名称, 秒数)；0 表示本次运行的内存统计 (最近一小时)
+DIAG_RANGES = [("最近1小时 (本次运行)", 0), ("最近24小时", 86400), ("最近7天", 7 * 86400), ("最近30天", 30 * 86400)]
 
 class SettingsPage(QWidget):
-    def __init__(self):
+    def __init__(self, db):
         super().__init__()
-        self.db = Database()
+        self.db = db
         main_layout = QVBoxLayout(self)
         main_layout.setContentsMargins(5, 5, 5, 5)
 
@@ -40,6 +46,11 @@ class SettingsPage(QWidget):
         self.init_sys_tab()
         self.tabs.addTab(self.tab_sys, "4. 系统维护")
         
+        # 5. 性能诊断
+        self.tab_diag = QWidget()
+        self.init_diag_tab()
+        self.tabs.addTab(self.tab_diag, "5. 性能诊断")
+        
         main_layout.addWidget(self.tabs)
         
         self.refresh_data()
@@ -99,11 +110,24 @@ class SettingsPage(QWidget):
         btn_del.clicked.connect(self.delete_box_rule)
         layout.addWidget(btn_del)
         
+        # 流水号预留：每次向数据库预留 N 个号，高速工位可减少计数器读写
+        h_block = QHBoxLayout()
+        self.spin_block = QSpinBox()
+        self.spin_block.setRange(1, 1000)
+        btn_block = QPushButton("保存")
+        btn_block.clicked.connect(self.save_block_size)
+        h_block.addWidget(QLabel("流水号预留数量 (多工位共用数据库时建议为1，下次预留号段时生效):"))
+        h_block.addWidget(self.spin_block)
+        h_block.addWidget(btn_block)
+        h_block.addStretch()
+        layout.addLayout(h_block)
+        
         self.current_box_id = None
 
     def load_box_rules(self):
+        self.spin_block.setValue(self.db.get_int_setting('box_seq_block_size', DEFAULT_BLOCK_SIZE))
         self.table_box.setRowCount(0)
-        cursor = self.db.conn.cursor()
+        cursor = self.db.read_conn.cursor()
         cursor.execute("SELECT id, name, rule_string FROM box_rules")
         for r_idx, row in enumerate(cursor.fetchall()):
             self.table_box.insertRow(r_idx)
@@ -111,6 +135,10 @@ class SettingsPage(QWidget):
             self.table_box.setItem(r_idx, 1, QTableWidgetItem(str(row[1])))
             self.table_box.setItem(r_idx, 2, QTableWidgetItem(str(row[2])))
 
+    def save_block_size(self):
+        self.db.set_setting('box_seq_block_size', str(self.spin_block.value()))
+        QMessageBox.information(self, "成功", "流水号预留数量已保存，下次预留号段时生效")
+
     def add_box_rule(self):
         name = self.box_name_edit.text().strip()
         fmt = self.box_fmt_edit.text().strip()
@@ -130,6 +158,7 @@ class SettingsPage(QWidget):
             self.db.cursor.execute("UPDATE box_rules SET name=?, rule_string=? WHERE id=?", 
                                    (self.box_name_edit.text(), self.box_fmt_edit.text(), self.current_box_id))
             self.db.conn.commit()
+            self.db.notify('box_rules', self.current_box_id) # 箱号规则模板缓存失效
             self.load_box_rules()
         except Exception as e:
             QMessageBox.warning(self, "错误", str(e))
@@ -140,6 +169,7 @@ class SettingsPage(QWidget):
             rid = self.table_box.item(row, 0).text()
             self.db.cursor.execute("DELETE FROM box_rules WHERE id=?", (rid,))
             self.db.conn.commit()
+            self.db.notify('box_rules', rid)
             self.load_box_rules()
 
     def on_box_table_click(self, item):
@@ -207,7 +237,7 @@ class SettingsPage(QWidget):
 
     def load_sn_rules(self):
         self.table_sn.setRowCount(0)
-        cursor = self.db.conn.cursor()
+        cursor = self.db.read_conn.cursor()
         cursor.execute("SELECT id, name, rule_string, length FROM sn_rules")
         for r_idx, row in enumerate(cursor.fetchall()):
             self.table_sn.insertRow(r_idx)
@@ -234,6 +264,7 @@ class SettingsPage(QWidget):
             self.db.cursor.execute("UPDATE sn_rules SET name=?, rule_string=?, length=? WHERE id=?", 
                                    (self.sn_name_edit.text(), self.sn_fmt_edit.text(), self.sn_len_spin.value(), self.current_sn_id))
             self.db.conn.commit()
+            self.db.notify('sn_rules', self.current_sn_id) # 打印页的预编译规则失效
             self.load_sn_rules()
         except Exception as e:
             QMessageBox.warning(self, "错误", str(e))
@@ -244,6 +275,7 @@ class SettingsPage(QWidget):
             rid = self.table_sn.item(row, 0).text()
             self.db.cursor.execute("DELETE FROM sn_rules WHERE id=?", (rid,))
             self.db.conn.commit()
+            self.db.notify('sn_rules', rid)
             self.load_sn_rules()
 
     def on_sn_table_click(self, item):
@@ -348,13 +380,40 @@ class SettingsPage(QWidget):
         self.combo_printer = QComboBox()
         self.combo_printer.addItems(self.get_available_printers())
         
+        # 同时保持打开的模板数量 (BarTender 模板缓存)
+        self.spin_fmt_cache = QSpinBox()
+        self.spin_fmt_cache.setRange(1, 32)
+        self.spin_fmt_cache.setValue(DEFAULT_FORMAT_CACHE_SIZE)
+        
         btn_save_printer = QPushButton("保存设置")
         btn_save_printer.clicked.connect(self.sel_default_printer)
         
         l_printer.addWidget(self.combo_printer)
+        l_printer.addWidget(QLabel("模板缓存:"))
+        l_printer.addWidget(self.spin_fmt_cache)
         l_printer.addWidget(btn_save_printer)
         l_printer.setStretchFactor(self.combo_printer, 1)
         layout.addWidget(g_printer)
+        
+        # 打印后端 (记录模式用于无打印机环境下的测试与性能测量)
+        g_backend = QGroupBox("打印后端")
+        l_backend = QHBoxLayout(g_backend)
+        self.combo_backend = QComboBox()
+        for key, label in PRINTER_BACKENDS:
+            self.combo_backend.addItem(label, key)
+        self.rec_path_edit = QLineEdit()
+        self.rec_path_edit.setPlaceholderText("记录文件 (留空则只保存在内存)")
+        self.spin_rec_latency = QSpinBox()
+        self.spin_rec_latency.setRange(0, 60000)
+        self.spin_rec_latency.setSuffix(" ms")
+        btn_save_backend = QPushButton("保存设置")
+        btn_save_backend.clicked.connect(self.save_printer_backend)
+        l_backend.addWidget(self.combo_backend)
+        l_backend.addWidget(self.rec_path_edit, 1)
+        l_backend.addWidget(QLabel("模拟耗时:"))
+        l_backend.addWidget(self.spin_rec_latency)
+        l_backend.addWidget(btn_save_backend)
+        layout.addWidget(g_backend)
         # ----------------------------
         
         # 备份路径
@@ -375,8 +434,14 @@ class SettingsPage(QWidget):
         b3.clicked.connect(self.do_backup)
         b4 = QPushButton("从文件恢复")
         b4.clicked.connect(self.do_restore)
+        b5 = QPushButton("重建每日统计")
+        b5.clicked.connect(self.do_rebuild_stats)
+        b6 = QPushButton("整理数据库")
+        b6.clicked.connect(self.do_vacuum)
         l3.addWidget(b3)
         l3.addWidget(b4)
+        l3.addWidget(b5)
+        l3.addWidget(b6)
         layout.addWidget(g3)
         
         layout.addStretch()
@@ -400,6 +465,19 @@ class SettingsPage(QWidget):
                 self.combo_printer.setCurrentIndex(0)
         else:
             self.combo_printer.setCurrentIndex(0)
+        self.spin_fmt_cache.setValue(self.db.get_int_setting('format_cache_size', DEFAULT_FORMAT_CACHE_SIZE))
+
+    def load_printer_backend(self):
+        idx = self.combo_backend.findData(self.db.get_setting('printer_backend') or DEFAULT_BACKEND)
+        self.combo_backend.setCurrentIndex(idx if idx >= 0 else 0)
+        self.rec_path_edit.setText(self.db.get_setting('recording_path') or "")
+        self.spin_rec_latency.setValue(self.db.get_int_setting('recording_latency_ms', 0))
+
+    def save_printer_backend(self):
+        self.db.set_setting('printer_backend', self.combo_backend.currentData())
+        self.db.set_setting('recording_path', self.rec_path_edit.text().strip())
+        self.db.set_setting('recording_latency_ms', str(self.spin_rec_latency.value()))
+        QMessageBox.information(self, "成功", f"打印后端已设置为: {self.combo_backend.currentText()}\n重启程序后生效")
 
     def sel_tmpl_path(self):
         p = QFileDialog.getExistingDirectory(self, "选择模板根目录")
@@ -421,8 +499,9 @@ class SettingsPage(QWidget):
         """保存用户选择的默认打印机。"""
         selected_printer = self.combo_printer.currentText()
         self.db.set_setting('default_printer', selected_printer)
+        self.db.set_setting('format_cache_size', str(self.spin_fmt_cache.value()))
         self.db.conn.commit()
-        QMessageBox.information(self, "成功", f"默认打印机已设置为: {selected_printer}")
+        QMessageBox.information(self, "成功", f"默认打印机已设置为: {selected_printer}\n模板缓存数量重启后生效")
 
     def do_backup(self):
         # 确保路径已保存并提交
@@ -437,6 +516,89 @@ class SettingsPage(QWidget):
                 ok, msg = self.db.restore_db(p)
                 QMessageBox.information(self, "结果", msg)
 
+    def do_rebuild_stats(self):
+        try:
+            self.db.rebuild_daily_stats()
+            QMessageBox.information(self, "结果", "每日装箱统计已重建")
+        except Exception as e: QMessageBox.critical(self, "错误", str(e))
+
+    def do_vacuum(self):
+        if QMessageBox.question(self, "整理数据库",
+                                "将重写整个数据库文件以回收空闲空间，记录较多时需要数分钟，期间程序无响应且其他工位无法写入。\n"
+                                "建议在停产时执行，确定继续？", QMessageBox.Yes|QMessageBox.No) != QMessageBox.Yes:
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try: ok, msg = self.db.vacuum()
+        finally: QApplication.restoreOverrideCursor()
+        if ok: QMessageBox.information(self, "结果", msg)
+        else: QMessageBox.critical(self, "错误", msg)
+
+    # ================= 5. 性能诊断 =================
+    def init_diag_tab(self):
+        layout = QVBoxLayout(self.tab_diag)
+        
+        top = QHBoxLayout()
+        self.combo_diag_range = QComboBox()
+        for label, _ in DIAG_RANGES: self.combo_diag_range.addItem(label)
+        self.combo_diag_range.currentIndexChanged.connect(self.load_diag)
+        btn = QPushButton("刷新")
+        btn.clicked.connect(self.load_diag)
+        top.addWidget(QLabel("统计范围:"))
+        top.addWidget(self.combo_diag_range)
+        top.addWidget(btn)
+        top.addStretch()
+        layout.addLayout(top)
+        
+        self.lbl_diag_rate = QLabel()
+        self.lbl_diag_rate.setStyleSheet("font-size: 16px; font-weight: bold;")
+        layout.addWidget(self.lbl_diag_rate)
+        
+        # 各阶段耗时分位数 (毫秒)
+        self.diag_table = QTableWidget()
+        self.diag_table.setColumnCount(7)
+        self.diag_table.setHorizontalHeaderLabels(["阶段", "次数", "平均(ms)", "p50(ms)", "p95(ms)", "p99(ms)", "最大(ms)"])
+        self.diag_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.diag_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.diag_table.verticalHeader().setVisible(False)
+        layout.addWidget(self.diag_table)
+        
+        self.lbl_diag_filter = QLabel()
+        layout.addWidget(self.lbl_diag_filter)
+        layout.addWidget(QLabel("说明：SN查重/校验慢多为扫码端或数据库问题，打印机出标慢为 BarTender/打印机问题，写入记录慢为数据库问题。"))
+
+    def load_diag(self):
+        try:
+            label, seconds = DIAG_RANGES[self.combo_diag_range.currentIndex()]
+            if seconds:
+                # 先写入当前时间片，再从数据库汇总
+                self.db.flush_metrics()
+                hists, boxes = self.db.load_metrics(int(time.time()) - seconds)
+                rate = boxes / (seconds / 3600)
+            else:
+                hists = self.db.metrics.snapshot()
+                rate = self.db.metrics.boxes_per_hour()
+            self.lbl_diag_rate.setText(f"每小时箱数: {rate:.1f}")
+            
+            fmt = lambda v: "" if v is None else f"{v:.2f}"
+            self.diag_table.setRowCount(len(STAGES))
+            for r, (stage, name) in enumerate(STAGES):
+                h = hists.get(stage)
+                vals = [name, str(h.count) if h else "0"]
+                if h: vals += [fmt(h.mean()), fmt(h.percentile(0.5)), fmt(h.percentile(0.95)), fmt(h.percentile(0.99)), fmt(h.max)]
+                else: vals += [""] * 5
+                for c, v in enumerate(vals): self.diag_table.setItem(r, c, QTableWidgetItem(v))
+            
+            f = self.db.sn_filter
+            if f is None:
+                self.lbl_diag_filter.setText("SN过滤器: 未加载 (查重直接查询数据库)")
+            else:
+                skip = f.negatives / f.lookups * 100 if f.lookups else 0
+                self.lbl_diag_filter.setText(
+                    f"SN过滤器: {f.count} 个SN, 查询 {f.lookups} 次, 免查库 {skip:.1f}%, "
+                    f"确认已打印 {f.true_positives} 次, 误判 {f.false_positives} 次")
+        except Exception as e:
+            print(f"Diag Load Error: {e}")
+
     # ================= 全局刷新 =================
     def refresh_data(self):
         self.load_box_rules()
@@ -444,3 +606,5 @@ class SettingsPage(QWidget):
         self.load_map()
         self.load_sys_paths()
         self.load_default_printer() # --- 新增调用 ---
+        self.load_printer_backend()
+        self.load_diag()